@@ -0,0 +1,337 @@
+"""
+HTTP API - 无界面的异步接口，与 Streamlit 前端共用 core 模块
+
+启动（多进程，每个 worker 独立事件循环，状态都在存储和 token 里）：
+    uvicorn api:app --workers 4 --host 0.0.0.0 --port 8000
+
+认证：POST /auth/sign-in 返回 access_token，其余接口带 Authorization: Bearer <token>，
+token 在本地校验签名（需要 SUPABASE_JWT_SECRET，或通过 SUPABASE_URL 获取 JWKS）。
+
+AI_CONCURRENCY：每个 worker 同时进行的 AI 调用上限（默认 8）
+CARD_CONCURRENCY：每个 worker 同时渲染的卡片上限（默认 2）
+QUEUE_TIMEOUT：排队超过该秒数返回 503（默认 10）
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+from contextlib import asynccontextmanager
+from datetime import date
+
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from core.db import (
+    SETTINGS_FIELDS, _get_secret, _today_str, get_storage,
+    get_user_settings, put_user_settings, write_daily_record,
+)
+
+# 卡片样式变化时递增，使客户端缓存的 ETag 失效
+CARD_VERSION = "1"
+
+_ai_slots = None
+_card_slots = None
+_queue_timeout = 10.0
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """按 worker 初始化并发限制，退出时关闭上游连接"""
+    global _ai_slots, _card_slots, _queue_timeout
+    from core.ai import close_async_http_client
+
+    _ai_slots = asyncio.Semaphore(int(_get_secret("AI_CONCURRENCY", "8")))
+    _card_slots = asyncio.Semaphore(int(_get_secret("CARD_CONCURRENCY", "2")))
+    _queue_timeout = float(_get_secret("QUEUE_TIMEOUT", "10"))
+    yield
+    await close_async_http_client()
+
+
+@asynccontextmanager
+async def _slot(sem: asyncio.Semaphore):
+    """占用一个并发名额，排队超时返回 503"""
+    try:
+        await asyncio.wait_for(sem.acquire(), _queue_timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(503, "服务繁忙，请稍后再试", headers={"Retry-After": "5"})
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+# ========== 工具 ==========
+
+async def _json_body(request) -> dict:
+    """读取 JSON 请求体"""
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(400, "请求体不是合法 JSON")
+    if not isinstance(body, dict):
+        raise HTTPException(400, "请求体必须是 JSON 对象")
+    return body
+
+
+def _number(body: dict, name: str, required: bool = True) -> float | None:
+    """读取数字字段（拒绝布尔值和 NaN / inf，避免写入后污染统计）"""
+    value = body.get(name)
+    if value is None and not required:
+        return None
+    try:
+        number = float(value) if not isinstance(value, bool) else math.nan
+    except (TypeError, ValueError):
+        number = math.nan
+    if not math.isfinite(number):
+        raise HTTPException(400, f"{name} 必须是有限数字")
+    return number
+
+
+def _parse_day(value: str) -> str:
+    """校验 ISO 日期"""
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(400, "日期格式应为 YYYY-MM-DD")
+
+
+def _auth_client():
+    """每次认证用独立的 Supabase 客户端，避免共享客户端的登录态串到其它请求"""
+    from core.db import create_supabase_client
+    client = create_supabase_client()
+    if client is None:
+        raise HTTPException(503, "未配置 Supabase")
+    return client
+
+
+async def _current_user(request) -> dict:
+    """校验 Bearer token，返回当前用户"""
+    from core.auth import verify_access_token
+
+    header = request.headers.get("authorization", "")
+    token = header[7:].strip() if header[:7].lower() == "bearer " else ""
+    # JWKS 首次获取公钥会访问网络，放到线程里
+    claims = await asyncio.to_thread(verify_access_token, token) if token else None
+    if not claims:
+        raise HTTPException(401, "未登录或登录已过期")
+    return {"id": claims['sub'], "email": claims.get('email')}
+
+
+def _public_settings(settings: dict) -> dict:
+    """返回给客户端的设置（不回传 API 密钥）"""
+    data = {k: v for k, v in settings.items() if k != 'api_key'}
+    data['has_api_key'] = bool(settings.get('api_key'))
+    return data
+
+
+def _cache_headers(etag_source, max_age: int) -> dict:
+    """按内容生成 ETag，多个 worker 算出的值一致"""
+    raw = json.dumps([CARD_VERSION, etag_source], ensure_ascii=False, sort_keys=True)
+    return {
+        "ETag": f'"{hashlib.sha1(raw.encode()).hexdigest()[:20]}"',
+        "Cache-Control": f"private, max-age={max_age}" if max_age else "private, no-cache",
+    }
+
+
+def _not_modified(request, headers: dict) -> bool:
+    """客户端已有同版本卡片"""
+    return headers["ETag"] in request.headers.get("if-none-match", "")
+
+
+async def _render(fn, *args, **kwargs) -> bytes:
+    """在线程中渲染卡片（CPU 密集，受 CARD_CONCURRENCY 限制）"""
+    async with _slot(_card_slots):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+# ========== 认证 ==========
+
+async def sign_up_endpoint(request):
+    from core.auth import sign_up
+
+    body = await _json_body(request)
+    email, password = body.get('email', ''), body.get('password', '')
+    if not email or len(password) < 6:
+        raise HTTPException(400, "请填写邮箱和至少6位密码")
+    ok, msg = await asyncio.to_thread(sign_up, _auth_client(), email, password)
+    if not ok:
+        raise HTTPException(400, msg)
+    return JSONResponse({"message": msg}, status_code=201)
+
+
+async def sign_in_endpoint(request):
+    from core.auth import authenticate
+
+    body = await _json_body(request)
+    try:
+        user, tokens = await asyncio.to_thread(
+            authenticate, _auth_client(), body.get('email', ''), body.get('password', '')
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(401, str(e))
+    return JSONResponse({"user": user, **tokens})
+
+
+async def refresh_endpoint(request):
+    from core.auth import refresh_session
+
+    body = await _json_body(request)
+    try:
+        user, tokens = await asyncio.to_thread(refresh_session, _auth_client(), body.get('refresh_token', ''))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(401, str(e))
+    return JSONResponse({"user": user, **tokens})
+
+
+# ========== 用户数据 ==========
+
+async def settings_endpoint(request):
+    user = await _current_user(request)
+
+    if request.method == "PUT":
+        body = await _json_body(request)
+        updates = {k: body[k] for k in SETTINGS_FIELDS if k in body}
+        if 'exercises' in updates and not (
+            isinstance(updates['exercises'], list) and all(isinstance(x, str) for x in updates['exercises'])
+        ):
+            raise HTTPException(400, "exercises 必须是字符串列表")
+        if 'total_assets' in updates:
+            updates['total_assets'] = _number(updates, 'total_assets', required=False)
+        await asyncio.to_thread(put_user_settings, user['id'], updates)
+
+    settings = await asyncio.to_thread(get_user_settings, user['id'])
+    return JSONResponse(_public_settings(settings))
+
+
+async def generate_endpoint(request):
+    """生成当天处方：{amount, total_assets?}；{regenerate: true} 按当天记录重新生成"""
+    from core.ai import call_ai_async
+
+    user = await _current_user(request)
+    body = await _json_body(request)
+    settings = await asyncio.to_thread(get_user_settings, user['id'])
+    # 未配置密钥是客户端问题，不占用 AI 名额
+    if not settings['api_key']:
+        raise HTTPException(400, "请先配置 API 密钥")
+
+    regenerate = bool(body.get('regenerate'))
+    if regenerate:
+        current = settings['result']
+        if not current:
+            raise HTTPException(409, "今天还没有生成过处方")
+        amount, total_assets = current['amount'], current['total_assets']
+    else:
+        amount = _number(body, 'amount')
+        total_assets = _number(body, 'total_assets', required=False) or settings['total_assets']
+        if not total_assets or total_assets <= 0:
+            raise HTTPException(400, "请填写本金")
+
+    async with _slot(_ai_slots):
+        try:
+            result = await call_ai_async(
+                settings['api_key'], settings['model'], amount, total_assets, settings['exercises'],
+                regenerate=regenerate
+            )
+        except Exception as e:
+            raise HTTPException(502, str(e))
+
+    record = {
+        'amount': amount,
+        'total_assets': total_assets,
+        'roi': round((amount / total_assets) * 100, 2) if total_assets > 0 else 0,
+        **result
+    }
+    # 与前端一致：只有首次生成才更新本金
+    updates = {'result': record}
+    if not regenerate:
+        updates['total_assets'] = total_assets + amount
+    await asyncio.to_thread(write_daily_record, user['id'], record)
+    await asyncio.to_thread(put_user_settings, user['id'], updates)
+    return JSONResponse(record)
+
+
+# ========== 分享卡片 ==========
+
+async def card_endpoint(request):
+    """某天的分享卡片"""
+    from core.share import generate_share_card
+
+    user = await _current_user(request)
+    day = _parse_day(request.path_params['day'])
+    record = await asyncio.to_thread(get_storage().get_daily_record, user['id'], day)
+    if not record:
+        raise HTTPException(404, "当天没有处方")
+
+    fields = {
+        "amount": record['amount'], "roi": record.get('roi', 0),
+        "exercise": record['exercise'], "advice": record['advice'],
+    }
+    # 当天可能重新生成，每次都要校验；历史卡片不会再变
+    max_age = 0 if day == _today_str() else 86400
+    headers = _cache_headers(fields, max_age)
+    if _not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    png = await _render(generate_share_card, **fields)
+    return Response(png, media_type="image/png", headers=headers)
+
+
+async def heatmap_endpoint(request):
+    """月度 / 年度热力图卡片：?year=2026[&month=10]"""
+    from core.share import generate_heatmap_card
+
+    user = await _current_user(request)
+    try:
+        year = int(request.query_params.get('year') or date.today().year)
+        month = int(request.query_params['month']) if request.query_params.get('month') else None
+        if month is not None and not 1 <= month <= 12:
+            raise ValueError(month)
+        start = date(year, month or 1, 1)
+        end = date(year + 1, 1, 1) if not month or month == 12 else date(year, month + 1, 1)
+    except (ValueError, OverflowError):
+        raise HTTPException(400, "year / month 不合法")
+
+    rows = await asyncio.to_thread(
+        get_storage().list_daily_records, user['id'], end.isoformat(), (end - start).days
+    )
+    records = {r['date']: r['record'] for r in rows if r['date'] >= start.isoformat()}
+
+    etag_source = sorted(
+        (day, r.get('roi'), r.get('amount'), r.get('exercise')) for day, r in records.items()
+    )
+    headers = _cache_headers([year, month, etag_source], 0)
+    if _not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    png = await _render(generate_heatmap_card, records, year, month)
+    return Response(png, media_type="image/png", headers=headers)
+
+
+async def health_endpoint(request):
+    return JSONResponse({"ok": True})
+
+
+async def _http_error(request, exc: HTTPException):
+    """错误统一返回 {"error": 信息}"""
+    return JSONResponse({"error": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+
+
+app = Starlette(
+    routes=[
+        Route("/healthz", health_endpoint),
+        Route("/auth/sign-up", sign_up_endpoint, methods=["POST"]),
+        Route("/auth/sign-in", sign_in_endpoint, methods=["POST"]),
+        Route("/auth/refresh", refresh_endpoint, methods=["POST"]),
+        Route("/me/settings", settings_endpoint, methods=["GET", "PUT"]),
+        Route("/generate", generate_endpoint, methods=["POST"]),
+        Route("/cards/heatmap.png", heatmap_endpoint),
+        Route("/cards/{day}.png", card_endpoint),
+    ],
+    exception_handlers={HTTPException: _http_error},
+    lifespan=lifespan,
+)
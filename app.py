@@ -3,10 +3,15 @@
 主应用入口
 """
 
+from contextlib import contextmanager
+from functools import wraps
+
 import streamlit as st
-from core import get_user, sign_in, sign_out, sign_up, try_restore_session
-from core import get_supabase, load_user_data, save_user_data, call_ai, generate_share_card
-from config import DEFAULT_EXERCISES, MODELS
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from core import get_user, sign_in, sign_out, sign_up, try_restore_session, start_warmup, warm_login, cancel_warmup
+from core import start_exporter, profile_run, track_session
+from core import create_supabase_client, load_user_data, save_user_data, save_daily_record, load_community_panel
+from config import DEFAULT_EXERCISES, MODELS, VOLATILITY_TIERS
 
 # ========== 页面配置 ==========
 st.set_page_config(
@@ -17,7 +22,7 @@ st.set_page_config(
 )
 
 # ========== 样式 ==========
-st.markdown("""
+_STYLE = """
 <style>
 * { font-family: 'Inter', 'Noto Sans SC', -apple-system, sans-serif; }
 .stApp { background: linear-gradient(135deg, #f0f9ff 0%, #e0f2fe 30%, #f0fdf4 70%, #faf5ff 100%); }
@@ -55,17 +60,125 @@ header { display: none !important; }
 .stat-label { font-size: 0.75rem; color: #64748b; }
 @media (max-width: 768px) { .block-container { max-width: 100% !important; padding: 1rem !important; min-width: unset !important; } .result-grid { grid-template-columns: 1fr; } }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 # ========== 初始化（懒加载）==========
 def _get_supabase():
-    """懒加载 Supabase"""
+    """当前会话的 Supabase 客户端（懒加载；每个会话独立，登录态不会串到其它会话）"""
     if 'supabase' not in st.session_state:
-        st.session_state['supabase'] = get_supabase()
+        st.session_state['supabase'] = create_supabase_client()
     return st.session_state['supabase']
 
-# 尝试恢复登录状态
-user = try_restore_session(_get_supabase()) or st.session_state.get('user')
+def _show_msg(key: str):
+    """显示回调里留下的提示（一次性）"""
+    msg = st.session_state.pop(key, None)
+    if msg:
+        level, text = msg
+        getattr(st, level)(text)
+
+
+# ========== 执行钩子 ==========
+@contextmanager
+def _script_run(page: str | None = None):
+    """每次执行（整页或 fragment 重跑）的公共钩子：PROFILE 开启时采样剖析，登记会话活跃并裁剪空闲会话"""
+    with profile_run() as tags:
+        if page:
+            tags['page'] = page
+        track_session()
+        yield tags
+
+
+def _fragment(page: str):
+    """st.fragment 的包装：fragment 单独重跑不经过 main()，在这里补上执行钩子"""
+    def decorate(fn):
+        @wraps(fn)
+        def body(*args, **kwargs):
+            ctx = get_script_run_ctx()
+            if ctx is None or not ctx.fragment_ids_this_run:
+                # 整页重跑时钩子已由 main 外层执行
+                return fn(*args, **kwargs)
+            with _script_run(page):
+                return fn(*args, **kwargs)
+        return st.fragment(body)
+    return decorate
+
+
+# ========== 回调 ==========
+def _do_login():
+    """登录"""
+    email = st.session_state.get('login_email')
+    password = st.session_state.get('login_pwd')
+    if not email or not password:
+        st.session_state['login_msg'] = ('warning', "请填写邮箱和密码")
+        return
+    try:
+        supabase = _get_supabase()
+        if not supabase:
+            st.session_state['login_msg'] = ('error', "数据库未配置")
+            return
+        ok, msg = sign_in(supabase, email, password)
+        if ok:
+            warm_login()
+        else:
+            st.session_state['login_msg'] = ('error', msg)
+    except Exception as e:
+        st.session_state['login_msg'] = ('error', f"连接失败：{str(e)}")
+
+
+def _do_register():
+    """注册"""
+    email = st.session_state.get('reg_email')
+    password = st.session_state.get('reg_pwd')
+    if not email or not password:
+        st.session_state['reg_msg'] = ('warning', "请填写邮箱和密码")
+    elif len(password) < 6:
+        st.session_state['reg_msg'] = ('warning', "密码至少6位")
+    elif password != st.session_state.get('reg_pwd2'):
+        st.session_state['reg_msg'] = ('warning', "两次密码不一致")
+    else:
+        try:
+            supabase = _get_supabase()
+            if not supabase:
+                st.session_state['reg_msg'] = ('error', "数据库未配置")
+                return
+            ok, msg = sign_up(supabase, email, password)
+            st.session_state['reg_msg'] = ('success' if ok else 'error', msg)
+        except Exception as e:
+            st.session_state['reg_msg'] = ('error', f"连接失败：{str(e)}")
+
+
+def _generate(user, amount: float, total_assets: float, is_regen: bool):
+    """调用 AI 生成处方并保存（失败时抛异常）"""
+    from core import call_ai
+    # 前台生成优先，后台预热剩余步骤不再抢连接和 CPU
+    cancel_warmup()
+    result = call_ai(
+        st.session_state['api_key'],
+        st.session_state['model'],
+        amount,
+        total_assets,
+        _exercise_pool(),
+        regenerate=is_regen
+    )
+    roi = round((amount / total_assets) * 100, 2) if total_assets > 0 else 0
+    st.session_state['result'] = {
+        'amount': amount,
+        'total_assets': total_assets,
+        'roi': roi,
+        **result
+    }
+    # 追加写入每日历史（重新生成会覆盖当天记录）
+    save_daily_record(user['id'], st.session_state['result'])
+    # 当天处方两种情况都要保存，只有首次生成才更新本金
+    if not is_regen:
+        st.session_state['total_assets'] = total_assets + amount
+    save_user_data(user['id'])
+
+
+def _goto(page: str):
+    """切换页面"""
+    st.session_state['page'] = page
+
 
 # ========== 页面组件 ==========
 def show_auth_page():
@@ -79,91 +192,21 @@ def show_auth_page():
     
     tab1, tab2 = st.tabs(["登录", "注册"])
     
+    # 表单统一提交，回调在重跑前执行，登录成功后本次运行直接渲染首页
     with tab1:
-        email = st.text_input("邮箱", key="login_email")
-        password = st.text_input("密码", type="password", key="login_pwd")
-        
-        is_loading = st.session_state.get('login_loading', False)
-        
-        if st.button(
-            "登录中..." if is_loading else "登录",
-            use_container_width=True,
-            disabled=is_loading,
-            key="login_btn"
-        ):
-            if email and password:
-                st.session_state['login_loading'] = True
-                st.session_state['login_data'] = (email, password)
-                st.rerun()
-            else:
-                st.warning("请填写邮箱和密码")
-        
-        # 执行登录
-        if is_loading and 'login_data' in st.session_state:
-            email, password = st.session_state['login_data']
-            try:
-                supabase = _get_supabase()
-                if not supabase:
-                    st.error("数据库未配置")
-                else:
-                    ok, msg = sign_in(supabase, email, password)
-                    if ok:
-                        st.session_state['login_loading'] = False
-                        if 'login_data' in st.session_state:
-                            del st.session_state['login_data']
-                        st.rerun()
-                    else:
-                        st.error(msg)
-            except Exception as e:
-                st.error(f"连接失败：{str(e)}")
-            # 无论成功失败都重置状态
-            st.session_state['login_loading'] = False
-            if 'login_data' in st.session_state:
-                del st.session_state['login_data']
+        with st.form("login_form"):
+            st.text_input("邮箱", key="login_email")
+            st.text_input("密码", type="password", key="login_pwd")
+            st.form_submit_button("登录", use_container_width=True, on_click=_do_login)
+        _show_msg('login_msg')
     
     with tab2:
-        email2 = st.text_input("邮箱", key="reg_email")
-        password2 = st.text_input("密码（至少6位）", type="password", key="reg_pwd")
-        password3 = st.text_input("确认密码", type="password", key="reg_pwd2")
-        
-        is_reg_loading = st.session_state.get('reg_loading', False)
-        
-        if st.button(
-            "注册中..." if is_reg_loading else "注册",
-            use_container_width=True,
-            disabled=is_reg_loading,
-            key="reg_btn"
-        ):
-            if not email2 or not password2:
-                st.warning("请填写邮箱和密码")
-            elif len(password2) < 6:
-                st.warning("密码至少6位")
-            elif password2 != password3:
-                st.warning("两次密码不一致")
-            else:
-                st.session_state['reg_loading'] = True
-                st.session_state['reg_data'] = (email2, password2)
-                st.rerun()
-        
-        # 执行注册
-        if is_reg_loading and 'reg_data' in st.session_state:
-            email2, password2 = st.session_state['reg_data']
-            try:
-                supabase = _get_supabase()
-                if not supabase:
-                    st.error("数据库未配置")
-                else:
-                    ok, msg = sign_up(supabase, email2, password2)
-                    if ok:
-                        st.success(msg)
-                    else:
-                        st.error(msg)
-            except Exception as e:
-                st.error(f"连接失败：{str(e)}")
-            # 无论成功失败都重置状态
-            st.session_state['reg_loading'] = False
-            if 'reg_data' in st.session_state:
-                del st.session_state['reg_data']
+        with st.form("reg_form"):
+            st.text_input("邮箱", key="reg_email")
+            st.text_input("密码（至少6位）", type="password", key="reg_pwd")
+            st.text_input("确认密码", type="password", key="reg_pwd2")
+            st.form_submit_button("注册", use_container_width=True, on_click=_do_register)
+        _show_msg('reg_msg')
 
 
 def show_home_page(user):
@@ -176,12 +219,32 @@ def show_home_page(user):
     </div>''', unsafe_allow_html=True)
     
     # 判断当前视图：有结果就显示结果页，否则显示输入页
-    has_result = 'result' in st.session_state
-    is_generating = st.session_state.get('generating', False)
-    
-    if has_result and not is_generating:
+    if 'result' in st.session_state:
         # ===== 结果页 =====
+        _result_view(user)
+    
+    else:
+        # ===== 输入页 =====
+        _generate_form(user)
+    
+    st.markdown('<div class="footer">保持理性 · 保持运动 · 保持韭菜的自我修养</div>', unsafe_allow_html=True)
+
+
+@_fragment("home")
+def _result_view(user):
+    """结果区（fragment：重新生成只重跑这一块，生成期间显示加载提示）"""
+    card = st.container()
+    if st.button("🔄 重新生成", use_container_width=True):
         r = st.session_state['result']
+        try:
+            with st.spinner("重新生成中..."):
+                _generate(user, r['amount'], r['total_assets'], is_regen=True)
+        except Exception as e:
+            st.error(str(e))
+    
+    # 按钮在卡片下方，但先处理点击再渲染，本次运行直接显示新结果
+    r = st.session_state['result']
+    with card:
         amt = r['amount']
         roi = r.get('roi', 0)
         color = "profit" if amt > 0 else ("loss" if amt < 0 else "")
@@ -208,159 +271,182 @@ def show_home_page(user):
             <div class="exercise-card"><div class="exercise-title">运动处方</div><div class="exercise-list">{exercise_html}</div></div>
             <div class="advice-box"><div class="advice-title">AI 建议</div><div class="advice-text">{r['advice']}</div></div>
         </div>''', unsafe_allow_html=True)
-        
-        # 按钮区
-        if st.button("🔄 重新生成", use_container_width=True):
-            st.session_state['generating'] = True
-            st.session_state['gen_data'] = (r['amount'], r['total_assets'])
-            st.session_state['is_regenerate'] = True
-            st.rerun()
-        
-        # 分享按钮
+    
+    # 分享按钮（PIL / qrcode 只在渲染卡片时加载）
+    # 卡片缓存在会话里，会话空闲时会被裁剪，需要时再重新生成
+    card_key = (r['amount'], r.get('roi', 0), r['exercise'], r['advice'])
+    card_bytes = st.session_state.get('card_bytes')
+    if card_bytes is None or st.session_state.get('card_key') != card_key:
+        from core import generate_share_card
         card_bytes = generate_share_card(
             amount=r['amount'],
             roi=r.get('roi', 0),
             exercise=r['exercise'],
             advice=r['advice']
         )
-        st.download_button(
-            label="📤 下载分享卡片",
-            data=card_bytes,
-            file_name="韭菜处方单.png",
-            mime="image/png",
-            use_container_width=True
-        )
+        st.session_state['card_bytes'] = card_bytes
+        st.session_state['card_key'] = card_key
+    st.download_button(
+        label="📤 下载分享卡片",
+        data=card_bytes,
+        file_name="韭菜处方单.png",
+        mime="image/png",
+        on_click="ignore",
+        use_container_width=True
+    )
     
-    else:
-        # ===== 输入页 =====
-        if not st.session_state.get('api_key'):
-            st.warning("请先前往「设置」页面配置 API 密钥")
-        
-        st.markdown('<div class="section-title">📊 输入今日投资情况</div>', unsafe_allow_html=True)
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            saved_assets = st.session_state.get('total_assets')
-            total_assets = st.number_input(
-                "本金（元）", 
-                value=float(saved_assets) if saved_assets else None,
-                min_value=1.0,
-                step=1000.0,
-                placeholder="请输入本金",
-                help="你的投资本金总额，保存后下次自动填充"
-            )
-            if total_assets and total_assets != saved_assets:
-                st.session_state['total_assets'] = total_assets
-                save_user_data(user['id'])
-        
-        with col2:
-            amount = st.number_input("今日盈亏（元）", value=None, step=100.0, placeholder="正数盈利，负数亏损")
-        
-        # 收益率预览
-        if amount is not None and total_assets and total_assets > 0:
-            roi = (amount / total_assets) * 100
-            roi_color = "#ef4444" if roi > 0 else ("#10b981" if roi < 0 else "gray")
-            roi_str = f"+{roi:.2f}%" if roi > 0 else f"{roi:.2f}%"
-            st.markdown(f'<div style="text-align:center;color:{roi_color};font-size:1.2rem;margin:0.5rem 0">收益率：{roi_str}</div>', unsafe_allow_html=True)
-        
-        btn_label = "生成中..." if is_generating else "生成处方"
+    _show_community_panel()
+
+
+def _show_community_panel():
+    """今日全站统计（读增量计数器，不扫描用户记录）"""
+    panel = load_community_panel()
+    if not panel['users']:
+        return
+    
+    with st.expander(f"🌏 今日韭菜众生相（{panel['users']} 位韭菜已打卡）"):
+        tiers = ''.join(
+            f'<div><div class="stat-value">{panel["tiers"].get(name, 0)}</div><div class="stat-label">{name}</div></div>'
+            for _, name in VOLATILITY_TIERS
+        )
+        st.markdown(f'<div class="stats">{tiers}</div>', unsafe_allow_html=True)
         
-        if st.button(btn_label, use_container_width=True, disabled=is_generating):
-            if not total_assets:
-                st.warning("请先输入本金")
-            elif amount is None:
-                st.warning("请先输入盈亏金额")
-            elif not st.session_state.get('api_key'):
-                st.info("请先配置 API 密钥")
-            else:
-                st.session_state['generating'] = True
-                st.session_state['gen_data'] = (amount, total_assets)
-                st.session_state['is_regenerate'] = False
-                st.rerun()
+        moods = ''.join(f'<span class="exercise-chip">{m} × {n}</span>' for m, n in panel['moods'].items())
+        st.markdown(f'<div class="section-title">心情分布</div><div>{moods}</div>', unsafe_allow_html=True)
         
-        # 执行生成
-        if is_generating and 'gen_data' in st.session_state:
-            amount, total_assets = st.session_state['gen_data']
-            is_regen = st.session_state.get('is_regenerate', False)
+        if panel['top_exercises']:
+            top = ''.join(f'<span class="exercise-chip">{ex} × {n}</span>' for ex, n in panel['top_exercises'])
+            st.markdown(f'<div class="section-title">热门处方</div><div>{top}</div>', unsafe_allow_html=True)
+
+
+@_fragment("home")
+def _generate_form(user):
+    """输入区（fragment：输入变化只重跑这一块，不写库）"""
+    if not st.session_state.get('api_key'):
+        st.warning("请先前往「设置」页面配置 API 密钥")
+    
+    st.markdown('<div class="section-title">📊 输入今日投资情况</div>', unsafe_allow_html=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        saved_assets = st.session_state.get('total_assets')
+        total_assets = st.number_input(
+            "本金（元）", 
+            value=float(saved_assets) if saved_assets else None,
+            min_value=1.0,
+            step=1000.0,
+            placeholder="请输入本金",
+            help="你的投资本金总额，生成处方后自动保存"
+        )
+    
+    with col2:
+        amount = st.number_input("今日盈亏（元）", value=None, step=100.0, placeholder="正数盈利，负数亏损")
+    
+    # 收益率预览
+    if amount is not None and total_assets and total_assets > 0:
+        roi = (amount / total_assets) * 100
+        roi_color = "#ef4444" if roi > 0 else ("#10b981" if roi < 0 else "gray")
+        roi_str = f"+{roi:.2f}%" if roi > 0 else f"{roi:.2f}%"
+        st.markdown(f'<div style="text-align:center;color:{roi_color};font-size:1.2rem;margin:0.5rem 0">收益率：{roi_str}</div>', unsafe_allow_html=True)
+    
+    if st.button("生成处方", use_container_width=True):
+        if not total_assets:
+            st.warning("请先输入本金")
+        elif amount is None:
+            st.warning("请先输入盈亏金额")
+        elif not st.session_state.get('api_key'):
+            st.info("请先配置 API 密钥")
+        else:
             try:
-                result = call_ai(
-                    st.session_state['api_key'],
-                    st.session_state['model'],
-                    amount,
-                    total_assets,
-                    st.session_state['exercises']
-                )
-                roi = round((amount / total_assets) * 100, 2) if total_assets > 0 else 0
-                st.session_state['result'] = {
-                    'amount': amount,
-                    'total_assets': total_assets,
-                    'roi': roi,
-                    **result
-                }
-                # 只有首次生成才更新本金
-                if not is_regen:
-                    new_assets = total_assets + amount
-                    st.session_state['total_assets'] = new_assets
-                    save_user_data(user['id'])
+                with st.spinner("生成中..."):
+                    _generate(user, amount, total_assets, is_regen=False)
+                # 切换到结果页需要整页重跑
+                st.rerun()
             except Exception as e:
                 st.error(str(e))
-            st.session_state['generating'] = False
-            if 'gen_data' in st.session_state:
-                del st.session_state['gen_data']
-            if 'is_regenerate' in st.session_state:
-                del st.session_state['is_regenerate']
-            st.rerun()
-    
-    st.markdown('<div class="footer">保持理性 · 保持运动 · 保持韭菜的自我修养</div>', unsafe_allow_html=True)
 
 
 def show_exercises_page(user):
     """动作池页面"""
     st.markdown('<div class="page-title">💪 动作池管理</div>', unsafe_allow_html=True)
     st.markdown('<div class="page-desc">自定义健身动作，AI 将从中推荐</div>', unsafe_allow_html=True)
-    
+    _exercise_editor(user)
+
+
+def _exercise_pool():
+    """会话内常驻的动作池对象，动作列表被整体替换（加载 / 恢复默认 / 清空）时才重建"""
     exercises = st.session_state.get('exercises', DEFAULT_EXERCISES)
+    cached = st.session_state.get('exercise_pool')
+    if cached is None or cached[0] is not exercises:
+        from core import ExercisePool
+        cached = (exercises, ExercisePool(exercises))
+        st.session_state['exercise_pool'] = cached
+    return cached[1]
+
+
+def _save_exercises(user):
+    """提交动作池修改（在常驻的动作池上增删，只在写库时序列化成列表）"""
+    pool = _exercise_pool()
+    changed = sum(pool.remove(name) for name in st.session_state.get('ex_del') or [])
+    new_names = [n.strip() for n in (st.session_state.get('ex_new') or '').replace('，', ',').split(',') if n.strip()]
+    dup = [n for n in new_names if not pool.add(n)]
+    changed += len(new_names) - len(dup)
+    if dup:
+        st.session_state['ex_msg'] = ('warning', f"已存在：{'、'.join(dup)}")
+    if changed:
+        exercises = pool.names()
+        st.session_state['exercises'] = exercises
+        st.session_state['exercise_pool'] = (exercises, pool)
+        save_user_data(user['id'])
+
+
+def _reset_exercises(user, exercises: list):
+    """整体替换动作池"""
+    st.session_state['exercises'] = exercises
+    save_user_data(user['id'])
+
+
+@_fragment("exercises")
+def _exercise_editor(user):
+    """动作池编辑区（fragment：增删只重跑这一块）"""
+    pool = _exercise_pool()
     st.markdown(f'''<div class="stats">
-        <div><div class="stat-value">{len(exercises)}</div><div class="stat-label">当前动作</div></div>
+        <div><div class="stat-value">{len(pool)}</div><div class="stat-label">当前动作</div></div>
         <div><div class="stat-value">{len(DEFAULT_EXERCISES)}</div><div class="stat-label">默认动作</div></div>
     </div>''', unsafe_allow_html=True)
     
     st.markdown("### 当前动作池")
-    if exercises:
-        chips = ''.join([f'<span class="exercise-chip">{ex}</span>' for ex in exercises])
+    if pool:
+        chips = ''.join(
+            f'<span class="exercise-chip">{ex}&nbsp;<span style="color:#94a3b8">{"·".join(pool.tags(ex))}</span></span>'
+            for ex in pool
+        )
         st.markdown(f'<div style="margin:12px 0">{chips}</div>', unsafe_allow_html=True)
-        to_del = st.selectbox("删除动作", [""] + exercises, format_func=lambda x: "选择要删除的动作" if x == "" else f"× {x}")
-        if to_del:
-            st.session_state['exercises'].remove(to_del)
-            save_user_data(user['id'])
-            st.rerun()
     else:
         st.info("动作池为空")
     
     st.markdown("---")
-    st.markdown("### 添加动作")
-    new_ex = st.text_input("动作名称", placeholder="如：引体向上")
-    if st.button("添加", use_container_width=True):
-        if new_ex and new_ex.strip():
-            if new_ex.strip() not in st.session_state['exercises']:
-                st.session_state['exercises'].append(new_ex.strip())
-                save_user_data(user['id'])
-                st.rerun()
-            else:
-                st.warning("已存在")
+    st.markdown("### 编辑动作")
+    with st.form("exercise_form", clear_on_submit=True):
+        st.multiselect("删除动作", list(pool), key="ex_del", placeholder="选择要删除的动作")
+        st.text_input("添加动作", key="ex_new", placeholder="如：引体向上，多个用逗号分隔")
+        st.form_submit_button("保存修改", use_container_width=True, on_click=_save_exercises, args=(user,))
+    _show_msg('ex_msg')
     
     st.markdown("---")
     c1, c2 = st.columns(2)
     with c1:
-        if st.button("恢复默认", use_container_width=True):
-            st.session_state['exercises'] = DEFAULT_EXERCISES.copy()
-            save_user_data(user['id'])
-            st.rerun()
+        st.button("恢复默认", use_container_width=True, on_click=_reset_exercises, args=(user, DEFAULT_EXERCISES.copy()))
     with c2:
-        if st.button("清空", use_container_width=True):
-            st.session_state['exercises'] = []
-            save_user_data(user['id'])
-            st.rerun()
+        st.button("清空", use_container_width=True, on_click=_reset_exercises, args=(user, []))
+
+
+def _select_model(user):
+    """切换模型"""
+    sel = st.session_state['model_sel']
+    st.session_state['model_name'] = sel
+    st.session_state['model'] = MODELS[sel]
+    save_user_data(user['id'])
 
 
 def show_settings_page(user):
@@ -403,18 +489,18 @@ def show_settings_page(user):
     st.markdown("---")
     st.markdown("### 模型选择")
     cur = st.session_state.get('model_name', 'DeepSeek-V3 (免费)')
-    sel = st.selectbox("模型", list(MODELS.keys()), index=list(MODELS.keys()).index(cur) if cur in MODELS else 0)
-    if sel != cur:
-        st.session_state['model_name'] = sel
-        st.session_state['model'] = MODELS[sel]
-        save_user_data(user['id'])
-        st.rerun()
+    st.selectbox(
+        "模型", list(MODELS.keys()),
+        index=list(MODELS.keys()).index(cur) if cur in MODELS else 0,
+        key="model_sel", on_change=_select_model, args=(user,)
+    )
     
     # 账户
     st.markdown("---")
     st.markdown("### 账户")
     st.info(f"当前账户：{user['email']}")
     if st.button("退出登录", use_container_width=True):
+        cancel_warmup()
         sign_out(_get_supabase())
         st.rerun()
     
@@ -425,34 +511,50 @@ def show_settings_page(user):
 
 
 # ========== 主逻辑 ==========
-if not user:
-    show_auth_page()
-else:
-    # 加载用户数据
-    if not st.session_state.get('data_loaded'):
-        load_user_data(user['id'])
-        st.session_state['data_loaded'] = True
+def main(tags: dict):
+    """单次脚本执行"""
+    st.markdown(_STYLE, unsafe_allow_html=True)
     
-    # 导航
-    page = st.session_state.get('page', 'home')
-    c1, c2, c3 = st.columns(3)
-    with c1:
-        if st.button("🏠 首页", use_container_width=True, type="primary" if page == 'home' else "secondary"):
-            st.session_state['page'] = 'home'
-            st.rerun()
-    with c2:
-        if st.button("💪 动作池", use_container_width=True, type="primary" if page == 'exercises' else "secondary"):
-            st.session_state['page'] = 'exercises'
-            st.rerun()
-    with c3:
-        if st.button("⚙️ 设置", use_container_width=True, type="primary" if page == 'settings' else "secondary"):
-            st.session_state['page'] = 'settings'
-            st.rerun()
+    # 指标导出（METRICS_PORT / METRICS_FILE 配置时开启，每个进程一次）
+    start_exporter()
     
-    # 页面路由
-    if page == 'home':
-        show_home_page(user)
-    elif page == 'exercises':
-        show_exercises_page(user)
-    elif page == 'settings':
-        show_settings_page(user)
+    # 后台预热（WARMUP=1 时开启，每个进程一次，不阻塞页面）
+    start_warmup()
+    
+    # 尝试恢复登录状态
+    user = try_restore_session(_get_supabase()) or st.session_state.get('user')
+    
+    if not user:
+        tags['page'] = 'auth'
+        show_auth_page()
+    else:
+        # 加载用户数据
+        if not st.session_state.get('data_loaded'):
+            load_user_data(user['id'])
+            st.session_state['data_loaded'] = True
+    
+        # 导航（回调里切换页面，避免额外重跑）
+        page = st.session_state.get('page', 'home')
+        tags['page'] = page
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            st.button("🏠 首页", use_container_width=True, type="primary" if page == 'home' else "secondary",
+                      on_click=_goto, args=('home',))
+        with c2:
+            st.button("💪 动作池", use_container_width=True, type="primary" if page == 'exercises' else "secondary",
+                      on_click=_goto, args=('exercises',))
+        with c3:
+            st.button("⚙️ 设置", use_container_width=True, type="primary" if page == 'settings' else "secondary",
+                      on_click=_goto, args=('settings',))
+    
+        # 页面路由
+        if page == 'home':
+            show_home_page(user)
+        elif page == 'exercises':
+            show_exercises_page(user)
+        elif page == 'settings':
+            show_settings_page(user)
+
+
+with _script_run() as tags:
+    main(tags)
@@ -0,0 +1,101 @@
+"""
+冷启动基准测试 - 统计各模块导入耗时和首屏渲染耗时
+
+用法：
+    python benchmarks/cold_start.py [--runs 3]
+
+每次测量都在全新的子进程中执行，避免模块缓存影响结果。
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 需要统计导入耗时的模块
+MODULES = [
+    "config",
+    "core",
+    "core.auth",
+    "core.db",
+    "core.ai",
+    "core.share",
+    "streamlit",
+    "supabase",
+    "requests",
+    "PIL.Image",
+    "qrcode",
+]
+
+# 首屏渲染：用 AppTest 无头执行一次 app.py
+_FIRST_RENDER = """
+import time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=60).run()
+print(time.perf_counter() - t0)
+"""
+
+
+def _import_time(module: str) -> float | None:
+    """在子进程中导入模块，返回累计导入耗时（毫秒）"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return None
+    # importtime 输出的最后一行是目标模块本身：self | cumulative | name
+    for line in reversed(proc.stderr.splitlines()):
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000
+    return None
+
+
+def _first_render() -> tuple[float, float] | None:
+    """在子进程中跑一次 app.py，返回 (进程总耗时, 脚本渲染耗时) 毫秒"""
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", _FIRST_RENDER],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    total = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        return None
+    return total, float(proc.stdout.strip().splitlines()[-1]) * 1000
+
+
+def _fmt(values: list) -> str:
+    """格式化中位数"""
+    values = [v for v in values if v is not None]
+    return f"{statistics.median(values):9.1f}" if values else "      n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动基准测试")
+    parser.add_argument("--runs", type=int, default=3, help="每项重复次数（取中位数）")
+    args = parser.parse_args()
+    
+    print(f"{'模块':<16}{'导入耗时(ms)':>12}")
+    print("-" * 28)
+    for module in MODULES:
+        times = [_import_time(module) for _ in range(args.runs)]
+        print(f"{module:<16}{_fmt(times)}")
+    
+    renders = [_first_render() for _ in range(args.runs)]
+    renders = [r for r in renders if r]
+    print()
+    if renders:
+        print(f"首屏渲染（含进程启动）: {_fmt([r[0] for r in renders]).strip()} ms")
+        print(f"首屏渲染（AppTest 内）: {_fmt([r[1] for r in renders]).strip()} ms")
+    else:
+        print("首屏渲染: 失败（需要安装 streamlit）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+端到端重跑基准测试 - 用 Streamlit AppTest 无头驱动 app.py
+
+用法：
+    python benchmarks/rerun_latency.py [--iterations 20]
+
+Supabase 认证和 AI 接口都替换为进程内假实现，数据存到临时 SQLite，
+不会访问网络。每轮从登录开始走完整流程：
+登录 → 生成处方 → 重新生成 → 下载卡片 → 动作池增删 → 设置页 → 退出，
+统计每个用户动作触发的脚本执行次数、每次执行耗时、存储写入次数（upsert_*、统计增量合并、
+社区计数累加都算），以及多轮之后的内存增长。
+"""
+
+import argparse
+import gc
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import core  # noqa: E402
+import core.ai  # noqa: E402
+import core.db  # noqa: E402
+from core.storage import SQLiteStorage  # noqa: E402
+
+USER_ID = "bench-user"
+EMAIL = "leek@example.com"
+PASSWORD = "123456"
+
+AI_REPLY = "【心情】上头\n【运动】深蹲 20 个, 平板支撑 60 秒\n【建议】涨了别飘，先蹲二十个冷静一下。"
+
+
+# ========== 假实现 ==========
+
+class FakeAuth:
+    """模拟 supabase.auth"""
+
+    def _session(self):
+        user = SimpleNamespace(id=USER_ID, email=EMAIL)
+        session = SimpleNamespace(
+            access_token="fake-access", refresh_token="fake-refresh",
+            expires_at=int(time.time()) + 3600, user=user
+        )
+        return SimpleNamespace(user=user, session=session)
+
+    def sign_in_with_password(self, credentials):
+        return self._session()
+
+    def sign_up(self, credentials):
+        return self._session()
+
+    def refresh_session(self, refresh_token):
+        return self._session()
+
+    def get_session(self):
+        return None
+
+    def sign_out(self):
+        pass
+
+
+class FakeSupabase:
+    """模拟 Supabase 客户端（只用到认证，数据走 SQLite）"""
+
+    def __init__(self):
+        self.auth = FakeAuth()
+
+
+class FakeHttpSession:
+    """模拟 AI 接口"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        payload = {"choices": [{"message": {"content": AI_REPLY}}]}
+        return SimpleNamespace(status_code=200, raise_for_status=lambda: None, json=lambda: payload)
+
+
+class Recorder:
+    """统计脚本执行：替换 core.profile_run，记录每次执行的页面和耗时"""
+
+    def __init__(self):
+        self.runs = []
+
+    @contextmanager
+    def profile_run(self):
+        tags = {}
+        t0 = time.perf_counter()
+        try:
+            yield tags
+        finally:
+            self.runs.append((tags.get('page', '-'), (time.perf_counter() - t0) * 1000))
+
+
+# 除 upsert_* 外会修改数据的存储方法
+_MUTATING_METHODS = {"apply_stats_delta", "apply_stats_deltas", "increment_counters"}
+
+
+class WriteCounter:
+    """统计存储写入次数（每次调用修改数据的 Storage 方法记一次）"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.writes = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.storage, name)
+        if name.startswith("upsert_") or name in _MUTATING_METHODS:
+            def wrapper(*args, **kwargs):
+                self.writes += 1
+                return attr(*args, **kwargs)
+            return wrapper
+        return attr
+
+
+# ========== 流程 ==========
+
+def _button(at, label):
+    """按文字查找按钮"""
+    return next(b for b in at.button if b.label == label)
+
+
+def _flow(at):
+    """一轮完整用户流程，按动作名依次 yield"""
+    at.run()
+    yield "open"
+
+    at.text_input(key="login_email").input(EMAIL)
+    at.text_input(key="login_pwd").input(PASSWORD)
+    _button(at, "登录").click().run()
+    yield "login"
+
+    at.number_input[0].set_value(100000.0)
+    at.number_input[1].set_value(-1500.0).run()
+    yield "input"
+
+    _button(at, "生成处方").click().run()
+    yield "generate"
+
+    _button(at, "🔄 重新生成").click().run()
+    yield "regenerate"
+
+    at.download_button[0].click().run()
+    yield "download_card"
+
+    _button(at, "💪 动作池").click().run()
+    yield "nav_exercises"
+
+    at.text_input(key="ex_new").input("引体向上")
+    _button(at, "保存修改").click().run()
+    yield "add_exercise"
+
+    at.multiselect(key="ex_del").select("引体向上")
+    _button(at, "保存修改").click().run()
+    yield "delete_exercise"
+
+    _button(at, "⚙️ 设置").click().run()
+    yield "nav_settings"
+
+    _button(at, "退出登录").click().run()
+    yield "sign_out"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端重跑基准测试")
+    parser.add_argument("--iterations", type=int, default=20, help="完整流程执行轮数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    storage = WriteCounter(SQLiteStorage(str(Path(tmp.name) / "bench.db")))
+
+    recorder = Recorder()
+    http = FakeHttpSession()
+    core.create_supabase_client = FakeSupabase
+    core.db.set_storage(storage)
+    core.ai.get_http_session = lambda: http
+    core.profile_run = recorder.profile_run
+
+    per_action = {}   # 动作 -> {runs: [...], ms: [...], writes: [...]}
+    memory = []
+
+    tracemalloc.start()
+    for i in range(args.iterations):
+        # 每轮重置为"今天还没生成过"的状态（直接写底层存储，不计入写入次数）
+        storage.storage.upsert_settings({
+            "id": USER_ID, "api_key": "sk-bench", "exercises": None,
+            "total_assets": 100000.0, "today_record": None, "record_date": None
+        })
+        at = AppTest.from_file(str(ROOT / "app.py"), default_timeout=30)
+        for action in _flow_wrapper(at, recorder, storage, per_action):
+            if at.exception:
+                raise RuntimeError(f"{action}: {at.exception[0].message}")
+        del at
+        gc.collect()
+        memory.append(tracemalloc.get_traced_memory()[0] / 1024)
+    tracemalloc.stop()
+
+    report = {
+        "iterations": args.iterations,
+        "ai_calls": http.calls,
+        "actions": {
+            action: {
+                "reruns": statistics.mean(v["runs"]),
+                "rerun_ms_p50": statistics.median(v["ms"]),
+                "rerun_ms_max": max(v["ms"]),
+                "db_writes": statistics.mean(v["writes"]),
+            }
+            for action, v in per_action.items()
+        },
+        "memory_kb_first": round(memory[0], 1),
+        "memory_kb_last": round(memory[-1], 1),
+    }
+    tmp.cleanup()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'动作':<18}{'脚本执行/次':>12}{'单次p50(ms)':>14}{'单次max(ms)':>14}{'DB写入/次':>12}")
+    print("-" * 70)
+    for action, r in report["actions"].items():
+        print(f"{action:<18}{r['reruns']:>12.1f}{r['rerun_ms_p50']:>14.1f}{r['rerun_ms_max']:>14.1f}{r['db_writes']:>12.1f}")
+    print()
+    growth = report["memory_kb_last"] - report["memory_kb_first"]
+    print(f"内存（tracemalloc）：第 1 轮后 {report['memory_kb_first']:.0f} KB，"
+          f"第 {args.iterations} 轮后 {report['memory_kb_last']:.0f} KB，增长 {growth:+.0f} KB")
+
+
+def _flow_wrapper(at, recorder, storage, per_action):
+    """执行流程并把每个动作的脚本执行次数、耗时和写入次数计入 per_action"""
+    runs_before = len(recorder.runs)
+    writes_before = storage.writes
+    for action in _flow(at):
+        new_runs = recorder.runs[runs_before:]
+        stats = per_action.setdefault(action, {"runs": [], "ms": [], "writes": []})
+        stats["runs"].append(len(new_runs))
+        stats["ms"].extend(ms for _, ms in new_runs)
+        stats["writes"].append(storage.writes - writes_before)
+        runs_before = len(recorder.runs)
+        writes_before = storage.writes
+        yield action
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,81 @@
 """
-配置模块 - 从 YAML 和 TXT 文件加载配置
+配置模块 - 从 YAML 和 TXT 文件加载配置（首次访问时懒加载）
 """
 
-import yaml
 from pathlib import Path
 
 _config_dir = Path(__file__).parent
+_config = None
 
-# 加载 YAML 配置
-with open(_config_dir / "config.yaml", "r", encoding="utf-8") as f:
-    _config = yaml.safe_load(f)
+# 导出名 -> 读取方式（首次访问时才解析 YAML / 读取 Prompt）
+_EXPORTS = {
+    "DEFAULT_EXERCISES": lambda c: c["exercises"],
+    "MODELS": lambda c: c["models"],
+    "DEFAULT_MODEL": lambda c: c["default_model"],
+    "DEFAULT_MODEL_NAME": lambda c: c["default_model_name"],
+    "API_URL": lambda c: c["api"]["url"],
+    "API_TIMEOUT": lambda c: c["api"]["timeout"],
+    "API_TEMPERATURE": lambda c: c["api"]["temperature"],
+    "MOOD_KEYWORDS": lambda c: c["mood_keywords"],
+    "EXERCISE_TAGS": lambda c: c.get("exercise_tags", {}),
+    "STRUCTURED_OUTPUT": lambda c: c.get("structured_output", {}),
+}
 
-# 加载 Prompt
-with open(_config_dir / "prompt.txt", "r", encoding="utf-8") as f:
-    SYSTEM_PROMPT = f.read().strip()
 
-# 导出配置
-DEFAULT_EXERCISES = _config["exercises"]
-MODELS = _config["models"]
-DEFAULT_MODEL = _config["default_model"]
-DEFAULT_MODEL_NAME = _config["default_model_name"]
-API_URL = _config["api"]["url"]
-API_TIMEOUT = _config["api"]["timeout"]
-API_TEMPERATURE = _config["api"]["temperature"]
-MOOD_KEYWORDS = _config["mood_keywords"]
+def _load_config() -> dict:
+    """加载 YAML 配置（缓存）"""
+    global _config
+    if _config is None:
+        import yaml
+        with open(_config_dir / "config.yaml", "r", encoding="utf-8") as f:
+            _config = yaml.safe_load(f)
+    return _config
+
+
+def _load_prompt() -> str:
+    """加载 Prompt"""
+    with open(_config_dir / "prompt.txt", "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def __getattr__(name: str):
+    """懒加载配置项"""
+    if name == "SYSTEM_PROMPT":
+        value = _load_prompt()
+    elif name in _EXPORTS:
+        value = _EXPORTS[name](_load_config())
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+# 波动等级：(|ROI| 上限 %, 名称)，按顺序匹配
+VOLATILITY_TIERS = (
+    (1, "死水区"),
+    (3, "涟漪区"),
+    (7, "浪潮区"),
+    (float("inf"), "海啸区"),
+)
+
+
+def volatility_level(roi: float) -> str:
+    """根据收益率（%）计算波动等级"""
+    abs_roi = abs(roi)
+    for limit, name in VOLATILITY_TIERS:
+        if abs_roi < limit:
+            return name
+    return VOLATILITY_TIERS[-1][1]
 
 
 def build_user_prompt(amount: float, total_assets: float, exercise_str: str) -> str:
     """构建用户 prompt"""
     roi = (amount / total_assets) * 100 if total_assets > 0 else 0
-    abs_roi = abs(roi)
-    
-    # 计算波动等级
-    if abs_roi < 1:
-        volatility_level = "死水区"
-    elif abs_roi < 3:
-        volatility_level = "涟漪区"
-    elif abs_roi < 7:
-        volatility_level = "浪潮区"
-    else:
-        volatility_level = "海啸区"
+    level = volatility_level(roi)
     
     return f"""# User Context
 本金：{total_assets:.0f} 元
 今日盈亏：{amount:.2f} 元
 今日收益率 (ROI)：{roi:.2f}%
-波动等级：{volatility_level}
+波动等级：{level}
 当前可选动作池：{exercise_str}"""
@@ -1,14 +1,40 @@
 """
-核心模块
+核心模块（导出项按需懒加载，避免冷启动时加载 PIL / requests 等重依赖）
 """
 
-from .auth import get_user, sign_in, sign_out, sign_up, try_restore_session
-from .db import get_supabase, load_user_data, save_user_data
-from .ai import call_ai
-from .share import generate_share_card
+import importlib
 
-__all__ = [
-    'get_user', 'sign_in', 'sign_out', 'sign_up', 'try_restore_session',
-    'get_supabase', 'load_user_data', 'save_user_data',
-    'call_ai', 'generate_share_card'
-]
+# 导出名 -> 所在子模块
+_EXPORTS = {
+    'get_user': '.auth', 'sign_in': '.auth', 'sign_out': '.auth',
+    'sign_up': '.auth', 'try_restore_session': '.auth',
+    'authenticate': '.auth', 'refresh_session': '.auth', 'verify_access_token': '.auth',
+    'get_supabase': '.db', 'create_supabase_client': '.db', 'get_storage': '.db', 'set_storage': '.db',
+    'load_user_data': '.db', 'save_user_data': '.db',
+    'get_user_settings': '.db', 'put_user_settings': '.db', 'write_daily_record': '.db',
+    'save_daily_record': '.db', 'list_daily_records': '.db', 'load_user_stats': '.db',
+    'load_community_panel': '.db',
+    'call_ai': '.ai', 'call_ai_async': '.ai',
+    'ExercisePool': '.exercises', 'sample_exercises': '.exercises',
+    'generate_share_card': '.share', 'generate_heatmap_card': '.share',
+    'start_warmup': '.warmup', 'warm_login': '.warmup', 'cancel_warmup': '.warmup',
+    'start_exporter': '.metrics', 'render_prometheus': '.metrics',
+    'profile_run': '.profiler',
+    'track_session': '.session',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    """首次访问时才导入对应子模块"""
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -2,27 +2,82 @@
 AI 模块 - 处理 AI 调用
 """
 
-import requests
 from config import (
-    SYSTEM_PROMPT, build_user_prompt, MOOD_KEYWORDS,
-    API_URL, API_TIMEOUT, API_TEMPERATURE
+    SYSTEM_PROMPT, build_user_prompt, volatility_level, MOOD_KEYWORDS,
+    API_URL, API_TIMEOUT, API_TEMPERATURE, STRUCTURED_OUTPUT
 )
+from .exercises import ExercisePool, sample_exercises
+from .metrics import inc, timed
+
+# 复用连接池的 HTTP 会话（懒加载单例）
+_http_session = None
+
+
+def get_http_session():
+    """获取共享的 requests.Session，复用 DNS/TLS 连接"""
+    global _http_session
+    
+    if _http_session is None:
+        import requests  # 懒加载，只有真正调用 AI 时才导入
+        session = requests.Session()
+        session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        _http_session = session
+    return _http_session
+
+
+# 格式不合格且本地修复失败时，最多再请求上游的次数
+MAX_FORMAT_RETRIES = 1
+
+# 结构化输出的 JSON Schema
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "mood": {"type": "string"},
+        "exercise": {"type": "string"},
+        "advice": {"type": "string"},
+    },
+    "required": ["mood", "exercise", "advice"],
+    "additionalProperties": False,
+}
+
+# 结构化输出时追加在系统 Prompt 后的格式要求（json_object 模式要求 Prompt 中出现 JSON）
+JSON_INSTRUCTION = """
+
+# JSON Output
+不要输出上面的三行格式，只输出一个 JSON 对象，不要包含其他内容：
+{"mood": "两个字的心情", "exercise": "具体动作，多个用中文逗号分隔，休息填 休息", "advice": "建议"}"""
+
+# 中文键名 / 常见别名 -> 字段
+_KEY_ALIASES = {
+    "mood": "mood", "心情": "mood", "emotion": "mood",
+    "exercise": "exercise", "运动": "exercise", "exercises": "exercise", "workout": "exercise",
+    "advice": "advice", "建议": "advice", "suggestion": "advice",
+}
+
+# 提供方不支持 response_format 的模型（进程内记住，之后直接用文本格式）
+_unsupported_formats = set()
+# 400 错误信息包含这些词才视为不支持 response_format（不匹配单独的 "json"，以免把请求体错误误判）
+_FORMAT_ERROR_WORDS = ("response_format", "json_schema", "json_object")
+
+
+def _normalize_mood(m: str) -> str:
+    """心情归一到预设词，没有匹配时取前 4 个字"""
+    for w in MOOD_KEYWORDS:
+        if w in m:
+            return w
+    return m[:4]
 
 
 def _parse_response(text: str) -> dict:
-    """解析 AI 响应"""
+    """解析 AI 响应（文本格式，缺失的字段用默认值兜底）"""
     mood, exercise, advice = "麻木", "休息", text
     
     for line in text.split('\n'):
         if '【心情】' in line:
             m = line.split('】')[-1].strip().strip('：:')
-            for w in MOOD_KEYWORDS:
-                if w in m:
-                    mood = w
-                    break
             # 如果没匹配到预设词，直接用 AI 返回的
-            if mood == "麻木" and m:
-                mood = m[:4]  # 取前4个字
+            if m:
+                mood = _normalize_mood(m)
         elif '【运动】' in line:
             exercise = line.split('】')[-1].strip().strip('：:')
         elif '【建议】' in line:
@@ -31,34 +86,219 @@ def _parse_response(text: str) -> dict:
     return {"mood": mood, "exercise": exercise, "advice": advice, "full": text}
 
 
-def call_ai(api_key: str, model: str, amount: float, total_assets: float, exercises: list[str]) -> dict:
-    """调用 AI 生成建议"""
+def _validate(data, text: str) -> dict | None:
+    """严格校验结构化结果：三个字段齐全、都是字符串，心情和建议非空"""
+    if not isinstance(data, dict) or set(data) != {"mood", "exercise", "advice"}:
+        return None
+    if not all(isinstance(v, str) for v in data.values()):
+        return None
+    mood, exercise, advice = (data[k].strip() for k in ("mood", "exercise", "advice"))
+    if not mood or not advice:
+        return None
+    return {"mood": _normalize_mood(mood), "exercise": exercise or "休息", "advice": advice, "full": text}
+
+
+def _lines_result(text: str) -> dict | None:
+    """三行文本格式齐全时才返回结果"""
+    if not all(tag in text for tag in ('【心情】', '【运动】', '【建议】')):
+        return None
+    return _validate({k: v for k, v in _parse_response(text).items() if k != 'full'}, text)
+
+
+def _repair(text: str) -> dict | None:
+    """本地修复常见的格式偏差：代码块、前后多余文字、尾逗号、中文键名、动作写成列表"""
+    import json
+    import re
+    
+    start, end = text.find('{'), text.rfind('}')
+    if start < 0 or end <= start:
+        return _lines_result(text)
+    
+    raw = re.sub(r',\s*([}\]])', r'\1', text[start:end + 1])
+    # 依次尝试：原样、把中文引号当作 JSON 引号
+    for candidate in (raw, raw.replace('“', '"').replace('”', '"')):
+        try:
+            data = json.loads(candidate)
+            break
+        except ValueError:
+            continue
+    else:
+        return _lines_result(text)
+    if not isinstance(data, dict):
+        return None
+    
+    fixed = {}
+    for key, value in data.items():
+        field = _KEY_ALIASES.get(str(key).strip().lower())
+        if field and field not in fixed:
+            if isinstance(value, list):
+                value = '，'.join(str(v).strip() for v in value if str(v).strip())
+            fixed[field] = value if isinstance(value, str) else str(value)
+    return _validate(fixed, text)
+
+
+def _interpret(text: str, fmt: str | None) -> tuple[dict | None, str]:
+    """按请求的格式解析，返回 (结果, ok / repaired / failed)"""
+    import json
+    
+    if fmt:
+        try:
+            result = _validate(json.loads(text), text)
+        except ValueError:
+            result = None
+    else:
+        result = _lines_result(text)
+    if result:
+        return result, "ok"
+    
+    result = _repair(text)
+    return (result, "repaired") if result else (None, "failed")
+
+
+def _payload_format(payload: dict) -> str | None:
+    """请求实际使用的结构化格式（被提供方拒绝后为 None）"""
+    return payload.get("response_format", {}).get("type")
+
+
+def _response_format(model: str) -> str | None:
+    """模型使用的结构化输出格式（json_schema / json_object），不支持时为 None"""
+    if model in _unsupported_formats:
+        return None
+    return STRUCTURED_OUTPUT.get(model)
+
+
+def _build_request(api_key: str, model: str, amount: float, total_assets: float, exercises: list[str] | ExercisePool,
+                   fmt: str | None = None) -> tuple[dict, dict]:
+    """构造请求头和请求体"""
     if not api_key:
         raise Exception("请先配置 API 密钥")
     
-    exercise_str = ', '.join(exercises) if exercises else '休息'
+    # 只把与波动等级匹配的有限子集放进 Prompt，动作池再大 Prompt 长度也不变
+    roi = (amount / total_assets) * 100 if total_assets > 0 else 0
+    picked = sample_exercises(exercises, volatility_level(roi)) if exercises else []
+    exercise_str = ', '.join(picked) if picked else '休息'
     user_prompt = build_user_prompt(amount, total_assets, exercise_str)
-    
-    resp = requests.post(
-        API_URL,
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        },
-        json={
-            "model": model,
-            "messages": [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            "temperature": API_TEMPERATURE
-        },
-        timeout=API_TIMEOUT
-    )
-    
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT + (JSON_INSTRUCTION if fmt else "")},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": API_TEMPERATURE
+    }
+    if fmt == "json_schema":
+        payload["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "prescription", "strict": True, "schema": RESPONSE_SCHEMA},
+        }
+    elif fmt:
+        payload["response_format"] = {"type": "json_object"}
+    return headers, payload
+
+
+def _format_rejected(resp, payload: dict) -> bool:
+    """提供方拒绝 response_format（400 且错误信息提到该参数）时改用文本格式，并记住该模型
+
+    其它 400（如参数或内容错误）不在这里处理，交给 _response_text 抛出。
+    """
+    if resp.status_code != 400 or "response_format" not in payload:
+        return False
+    error = (resp.text or "").lower()
+    if not any(word in error for word in _FORMAT_ERROR_WORDS):
+        return False
+    _unsupported_formats.add(payload["model"])
+    del payload["response_format"]
+    payload["messages"][0] = {"role": "system", "content": SYSTEM_PROMPT}
+    return True
+
+
+def _response_text(resp) -> str:
+    """检查状态码并取出回复文本（requests / httpx 响应通用）"""
     if resp.status_code == 401:
         raise Exception("API 密钥无效")
     resp.raise_for_status()
+    return resp.json()['choices'][0]['message']['content'].strip()
+
+
+def _finish(model: str, payload: dict, text: str, result: dict | None, outcome: str, regenerate: bool) -> dict:
+    """记录格式和重新生成指标；修复和重试都失败时退回文本解析兜底"""
+    inc("ai_output_total", model=model, mode=_payload_format(payload) or "text", outcome=outcome)
+    inc("generations_total", model=model, kind="regenerate" if regenerate else "first")
+    return result or _parse_response(text)
+
+
+def call_ai(api_key: str, model: str, amount: float, total_assets: float, exercises: list[str] | ExercisePool,
+            regenerate: bool = False) -> dict:
+    """调用 AI 生成建议（regenerate 表示用户点了重新生成，只用于统计）"""
+    fmt = _response_format(model)
+    headers, payload = _build_request(api_key, model, amount, total_assets, exercises, fmt)
+    
+    for attempt in range(MAX_FORMAT_RETRIES + 1):
+        with timed("call_ai", model=model):
+            resp = get_http_session().post(API_URL, headers=headers, json=payload, timeout=API_TIMEOUT)
+            if _format_rejected(resp, payload):
+                resp = get_http_session().post(API_URL, headers=headers, json=payload, timeout=API_TIMEOUT)
+            text = _response_text(resp)
+        result, outcome = _interpret(text, _payload_format(payload))
+        if result:
+            break
+        # 本地修复失败才重试上游
+        if attempt < MAX_FORMAT_RETRIES:
+            inc("ai_format_retries_total", model=model)
+    if result and attempt:
+        outcome = "retried"
+    return _finish(model, payload, text, result, outcome, regenerate)
+
+
+# ========== 异步版本（供 HTTP API 使用）==========
+
+# 异步 HTTP 客户端（每个进程一个，绑定 API 服务的事件循环）
+_async_client = None
+
+
+def get_async_http_client():
+    """获取共享的 httpx.AsyncClient"""
+    global _async_client
+    
+    if _async_client is None:
+        import httpx
+        _async_client = httpx.AsyncClient(
+            timeout=API_TIMEOUT,
+            limits=httpx.Limits(max_connections=16, max_keepalive_connections=4)
+        )
+    return _async_client
+
+
+async def close_async_http_client():
+    """关闭异步 HTTP 客户端（服务退出时调用）"""
+    global _async_client
+    
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def call_ai_async(api_key: str, model: str, amount: float, total_assets: float, exercises: list[str] | ExercisePool,
+                        regenerate: bool = False) -> dict:
+    """异步调用 AI 生成建议（等待上游时不占用线程）"""
+    fmt = _response_format(model)
+    headers, payload = _build_request(api_key, model, amount, total_assets, exercises, fmt)
     
-    text = resp.json()['choices'][0]['message']['content'].strip()
-    return _parse_response(text)
+    for attempt in range(MAX_FORMAT_RETRIES + 1):
+        with timed("call_ai", model=model):
+            resp = await get_async_http_client().post(API_URL, headers=headers, json=payload)
+            if _format_rejected(resp, payload):
+                resp = await get_async_http_client().post(API_URL, headers=headers, json=payload)
+            text = _response_text(resp)
+        result, outcome = _interpret(text, _payload_format(payload))
+        if result:
+            break
+        if attempt < MAX_FORMAT_RETRIES:
+            inc("ai_format_retries_total", model=model)
+    if result and attempt:
+        outcome = "retried"
+    return _finish(model, payload, text, result, outcome, regenerate)
@@ -3,26 +3,196 @@
 """
 
 import streamlit as st
+import threading
+import time
 
+from .db import _get_secret
+from .metrics import count_error, instrumented
 
+# 提前多少秒刷新 token
+REFRESH_MARGIN = 60
+
+# 保存 token 的浏览器 Cookie（新开页面时据此在本地恢复登录，不访问网络）
+TOKEN_COOKIE = "stoic_leek_auth"
+# Cookie 有效期（秒），与 Supabase refresh token 默认有效期同量级
+TOKEN_COOKIE_MAX_AGE = 7 * 24 * 3600
+
+# 校验密钥缓存（HS256 密钥或 JWKS 客户端）
+_jwt_key = None
+_jwks_client = None
+
+
+def _get_jwt_key():
+    """获取 JWT 校验密钥（懒加载并缓存）"""
+    global _jwt_key, _jwks_client
+    
+    if _jwt_key is None:
+        _jwt_key = _get_secret("SUPABASE_JWT_SECRET")
+    if _jwt_key:
+        return _jwt_key
+    
+    # 非对称签名：从 Supabase 的 JWKS 获取公钥（PyJWKClient 自带缓存）
+    if _jwks_client is None:
+        url = _get_secret("SUPABASE_URL")
+        if not url:
+            return None
+        import jwt
+        _jwks_client = jwt.PyJWKClient(f"{url.rstrip('/')}/auth/v1/.well-known/jwks.json", lifespan=3600)
+    return _jwks_client
+
+
+def verify_access_token(token: str) -> dict | None:
+    """本地校验 access token 的签名和过期时间，成功返回 claims"""
+    if not token:
+        return None
+    try:
+        import jwt
+    except ImportError:
+        return None
+    
+    try:
+        key = _get_jwt_key()
+        if key is None:
+            return None
+        if isinstance(key, jwt.PyJWKClient):
+            key = key.get_signing_key_from_jwt(token).key
+            algorithms = ["RS256", "ES256"]
+        else:
+            algorithms = ["HS256"]
+        return jwt.decode(token, key, algorithms=algorithms, audience="authenticated")
+    except Exception:
+        return None
+
+
+def _session_tokens(session) -> dict:
+    """从 Supabase session 取出 token"""
+    return {
+        "access_token": session.access_token,
+        "refresh_token": session.refresh_token,
+        "expires_at": session.expires_at or 0,
+    }
+
+
+def _cookie_value(tokens: dict | None) -> str:
+    """token 编码为 Cookie 值（JWT 和 refresh token 中都不含 |）"""
+    if not tokens:
+        return ""
+    return f"{tokens['access_token']}|{tokens['refresh_token']}"
+
+
+def _read_cookie_tokens() -> dict | None:
+    """从浏览器 Cookie 读取 token（st.context.cookies 在会话建立时确定，每个会话只读一次）"""
+    try:
+        value = st.context.cookies.get(TOKEN_COOKIE)
+    except Exception:
+        return None
+    if not isinstance(value, str):
+        # 没有 Cookie，或不在真实会话中（AppTest 下为 Mock）
+        return None
+    access_token, _, refresh_token = value.partition("|")
+    if not (access_token and refresh_token):
+        return None
+    return {"access_token": access_token, "refresh_token": refresh_token, "expires_at": 0}
+
+
+def _sync_cookie(tokens: dict | None):
+    """token 变化（登录、后台刷新、退出）后把 Cookie 同步到浏览器"""
+    value = _cookie_value(tokens)
+    if st.session_state.get('_auth_cookie', "") == value:
+        return
+    st.session_state['_auth_cookie'] = value
+    
+    import json
+    max_age = TOKEN_COOKIE_MAX_AGE if value else 0
+    # HTML 字符串的 iframe 与页面同源，写父页面的 Cookie；https 下加 Secure（高度最小为 1 像素）
+    st.iframe(f"""<script>
+    const secure = window.parent.location.protocol === "https:" ? "; Secure" : "";
+    window.parent.document.cookie = "{TOKEN_COOKIE}=" + {json.dumps(value)}
+        + "; path=/; max-age={max_age}; SameSite=Strict" + secure;
+    </script>""", height=1)
+
+
+def _refresh_tokens(supabase, tokens: dict):
+    """后台刷新 token（原地更新 tokens）"""
+    try:
+        resp = supabase.auth.refresh_session(tokens['refresh_token'])
+        if resp.session:
+            tokens['access_token'] = resp.session.access_token
+            tokens['refresh_token'] = resp.session.refresh_token
+            tokens['expires_at'] = resp.session.expires_at or 0
+    except Exception:
+        # 刷新失败时让 token 自然过期，下次访问走网络兜底
+        pass
+    finally:
+        tokens.pop('timer', None)
+
+
+def _schedule_refresh(supabase, tokens: dict):
+    """在过期前 REFRESH_MARGIN 秒安排一次后台刷新"""
+    if not supabase or tokens.get('timer') or not tokens.get('expires_at'):
+        return
+    delay = max(tokens['expires_at'] - time.time() - REFRESH_MARGIN, 0)
+    timer = threading.Timer(delay, _refresh_tokens, args=(supabase, tokens))
+    timer.daemon = True
+    tokens['timer'] = timer
+    timer.start()
+
+
+def _cancel_refresh():
+    """取消已安排的刷新"""
+    tokens = st.session_state.get('auth_tokens') or {}
+    timer = tokens.pop('timer', None)
+    if timer:
+        timer.cancel()
+
+
+@instrumented("try_restore_session")
 def try_restore_session(supabase) -> dict | None:
-    """尝试恢复会话"""
+    """尝试恢复会话（优先本地校验 token，过期时才用 refresh token 访问网络）
+
+    新会话首次执行时从 Cookie 取回 token，刷新页面或新开标签页都无需重新登录。
+    supabase 应为当前会话独立的客户端，后台刷新会改写它的登录态。
+    """
+    tokens = st.session_state.get('auth_tokens')
+    
     # 已登录直接返回
     if st.session_state.get('user'):
+        if tokens:
+            _schedule_refresh(supabase, tokens)
+        _sync_cookie(tokens)
         return st.session_state['user']
     
-    # 尝试从 Supabase 获取当前 session
-    if supabase:
-        try:
-            session = supabase.auth.get_session()
-            if session and session.user:
-                user = {"id": session.user.id, "email": session.user.email}
-                st.session_state['user'] = user
-                return user
-        except:
-            pass
+    # 新会话：从 Cookie 取回 token，并记下浏览器里已有的值
+    if tokens is None and not st.session_state.get('_auth_cookie_checked'):
+        st.session_state['_auth_cookie_checked'] = True
+        tokens = _read_cookie_tokens()
+        st.session_state['_auth_cookie'] = _cookie_value(tokens)
+    
+    user = None
+    if tokens:
+        # 本地校验签名和过期时间
+        claims = verify_access_token(tokens.get('access_token'))
+        if claims:
+            user = {"id": claims['sub'], "email": claims.get('email')}
+            tokens['expires_at'] = claims.get('exp', 0)
+        elif supabase and tokens.get('refresh_token'):
+            # access token 过期或无法本地校验，才访问网络换新 token
+            try:
+                user, tokens = refresh_session(supabase, tokens['refresh_token'])
+            except Exception as e:
+                count_error("try_restore_session", e)
+                st.session_state['auth_error'] = str(e)
+                tokens = None
     
-    return None
+    if user:
+        st.session_state['user'] = user
+        st.session_state['data_loaded'] = False
+        st.session_state['auth_tokens'] = tokens
+        _schedule_refresh(supabase, tokens)
+    else:
+        st.session_state.pop('auth_tokens', None)
+    _sync_cookie(tokens if user else None)
+    return user
 
 
 def sign_up(supabase, email: str, password: str) -> tuple[bool, str]:
@@ -39,32 +209,60 @@ def sign_up(supabase, email: str, password: str) -> tuple[bool, str]:
         return False, msg
 
 
+def _sign_in_message(e: Exception) -> str:
+    """登录异常转为提示文案"""
+    msg = str(e)
+    if "Invalid login" in msg:
+        return "邮箱或密码错误"
+    if "Email not confirmed" in msg:
+        return "请先验证邮箱"
+    return msg
+
+
+def authenticate(supabase, email: str, password: str) -> tuple[dict, dict]:
+    """校验账号密码，返回 (用户, token)（不依赖会话状态，失败时抛异常）"""
+    try:
+        resp = supabase.auth.sign_in_with_password({"email": email, "password": password})
+    except Exception as e:
+        raise Exception(_sign_in_message(e)) from e
+    if not (resp.user and resp.session):
+        raise Exception("登录失败")
+    return {"id": resp.user.id, "email": resp.user.email}, _session_tokens(resp.session)
+
+
+def refresh_session(supabase, refresh_token: str) -> tuple[dict, dict]:
+    """用 refresh token 换新 token，返回 (用户, token)（失败时抛异常）"""
+    resp = supabase.auth.refresh_session(refresh_token)
+    if not (resp.user and resp.session):
+        raise Exception("登录已过期，请重新登录")
+    return {"id": resp.user.id, "email": resp.user.email}, _session_tokens(resp.session)
+
+
 def sign_in(supabase, email: str, password: str) -> tuple[bool, str]:
     """用户登录"""
     try:
-        resp = supabase.auth.sign_in_with_password({"email": email, "password": password})
-        if resp.user and resp.session:
-            user = {"id": resp.user.id, "email": resp.user.email}
-            st.session_state['user'] = user
-            st.session_state['data_loaded'] = False
-            return True, "登录成功"
-        return False, "登录失败"
+        user, tokens = authenticate(supabase, email, password)
     except Exception as e:
-        msg = str(e)
-        if "Invalid login" in msg:
-            return False, "邮箱或密码错误"
-        if "Email not confirmed" in msg:
-            return False, "请先验证邮箱"
-        return False, msg
+        return False, str(e)
+    st.session_state['user'] = user
+    st.session_state['data_loaded'] = False
+    st.session_state['auth_tokens'] = tokens
+    _schedule_refresh(supabase, tokens)
+    return True, "登录成功"
 
 
 def sign_out(supabase):
-    """退出登录"""
+    """退出登录（同时清除浏览器里的 token Cookie）"""
+    _cancel_refresh()
+    had_cookie = st.session_state.get('_auth_cookie', "")
     try:
         supabase.auth.sign_out()
     except:
         pass
     st.session_state.clear()
+    # 本会话不再读取 Cookie；下次执行时把它清掉
+    st.session_state['_auth_cookie_checked'] = True
+    st.session_state['_auth_cookie'] = had_cookie
 
 
 def get_user() -> dict | None:
@@ -0,0 +1,231 @@
+"""
+历史导入模块 - 流式读取 CSV 批量补录每日盈亏，可选并发生成处方
+
+CSV 列：date, amount[, total_assets]，可带表头；日期支持 2024-01-02 / 2024/01/02 / 20240102。
+行必须按日期升序且不重复（券商导出多为倒序，需先反转），否则在写入该批之前报错。
+缺失的本金按每日盈亏滚动计算（与首页生成逻辑一致），遇到给出本金的行重新以它为准；
+没有 total_assets 列时必须指定起始本金 --assets。
+
+用法：
+    python -m core.backfill history.csv --user <user_id> --assets 100000 [--generate --api-key sk-...]
+"""
+
+import csv
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+
+from config import VOLATILITY_TIERS
+
+# 每批写入的行数
+DEFAULT_BATCH_SIZE = 500
+# 生成处方的默认并发数
+DEFAULT_CONCURRENCY = 4
+
+# 波动等级边界（不含最后的 inf），供 searchsorted 使用
+_TIER_LIMITS = np.array([limit for limit, _ in VOLATILITY_TIERS[:-1]], dtype=float)
+_TIER_NAMES = np.array([name for _, name in VOLATILITY_TIERS])
+
+
+def _parse_date(value: str) -> str:
+    """解析日期为 ISO 字符串"""
+    value = value.strip().replace('/', '-')
+    if len(value) == 8 and value.isdigit():
+        value = f"{value[:4]}-{value[4:6]}-{value[6:]}"
+    return date.fromisoformat(value).isoformat()
+
+
+def _parse_amount(value: str) -> float:
+    """解析金额（允许千分位和 ¥）"""
+    return float(value.strip().replace(',', '').replace('¥', '') or 0)
+
+
+def _read_batches(path: str, batch_size: int):
+    """逐批读取 CSV，每批为 (日期列表, 盈亏列表, 本金列表)，缺失本金记为 NaN
+
+    滚动本金和连续打卡都依赖日期顺序，日期不晚于上一行（跨批比较）或缺少盈亏列时抛 ValueError。
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        days, amounts, assets = [], [], []
+        last_day = None
+        for row in reader:
+            if not row or not row[0].strip():
+                continue
+            try:
+                day = _parse_date(row[0])
+            except ValueError:
+                # 表头或无法识别的行
+                continue
+            if len(row) < 2 or not row[1].strip():
+                raise ValueError(f"第 {reader.line_num} 行缺少盈亏列：{','.join(row)}")
+            if last_day is not None and day <= last_day:
+                raise ValueError(
+                    f"第 {reader.line_num} 行日期 {day} 不晚于上一行 {last_day}，CSV 需按日期升序排列且不重复"
+                )
+            last_day = day
+            days.append(day)
+            amounts.append(_parse_amount(row[1]))
+            assets.append(_parse_amount(row[2]) if len(row) > 2 and row[2].strip() else np.nan)
+            if len(days) >= batch_size:
+                yield days, amounts, assets
+                days, amounts, assets = [], [], []
+        if days:
+            yield days, amounts, assets
+
+
+def compute_batch(amounts: list, assets: list, carry_assets: float | None) -> tuple:
+    """向量化计算一批的本金、ROI 和波动等级（各行须按日期升序，见 _read_batches）
+
+    CSV 给出本金的那天以它为准（重新锚定），之后缺失的本金 = 最近一次给出的本金 + 其后累计盈亏；
+    本批在第一个给出值之前缺失的本金从 carry_assets（上一批结转或起始本金）滚动。
+    返回 (本金数组, ROI 数组, 等级数组, 下一批的起始本金)
+    """
+    amount = np.asarray(amounts, dtype=float)
+    given = np.asarray(assets, dtype=float)
+    has = ~np.isnan(given)
+    if len(amount) and carry_assets is None and not has[0]:
+        raise ValueError("CSV 没有本金列（或首行缺失本金），请指定起始本金 --assets")
+
+    # cum[i] = 当天之前各天盈亏之和；锚点处 base = 本金 - cum，之后前向填充
+    cum = np.concatenate(([0.0], np.cumsum(amount)[:-1]))
+    anchor = np.maximum.accumulate(np.where(has, np.arange(len(amount)), -1))
+    base = np.where(anchor >= 0, (given - cum)[np.maximum(anchor, 0)], carry_assets or 0.0)
+    total = base + cum
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi = np.where(total > 0, amount / total * 100, 0.0)
+    tiers = _TIER_NAMES[np.searchsorted(_TIER_LIMITS, np.abs(roi), side='right')]
+    roi = np.round(roi, 2)
+
+    next_assets = float(total[-1] + amount[-1]) if len(total) else carry_assets
+    return total, roi, tiers, next_assets
+
+
+def backfill(
+    storage,
+    user_id: str,
+    path: str,
+    initial_assets: float | None = None,
+    generate: bool = False,
+    api_key: str = "",
+    model: str = "",
+    exercises: list[str] | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    progress=None,
+) -> dict:
+    """导入历史盈亏，返回统计信息
+
+    CSV 没有本金列时必须提供 initial_assets，否则在写入前抛 ValueError。
+    progress(rows, seconds) 每批写入后回调一次。
+    """
+    from .ai import call_ai
+    from .db import _stats_delta
+
+    if generate and not api_key:
+        raise Exception("请先配置 API 密钥")
+    if generate and not exercises:
+        from config import DEFAULT_EXERCISES
+        exercises = DEFAULT_EXERCISES
+
+    carry = float(initial_assets) if initial_assets is not None else None
+    rows_done = generated = failed = 0
+    t0 = time.perf_counter()
+
+    executor = ThreadPoolExecutor(max_workers=max(concurrency, 1)) if generate else None
+    try:
+        for days, amounts, assets in _read_batches(path, batch_size):
+            total, roi, tiers, carry = compute_batch(amounts, assets, carry)
+
+            records = [
+                {
+                    'amount': amounts[i],
+                    'total_assets': round(float(total[i]), 2),
+                    'roi': float(roi[i]),
+                    'volatility': str(tiers[i]),
+                    'mood': None, 'exercise': '', 'advice': '',
+                }
+                for i in range(len(days))
+            ]
+
+            # 并发生成处方（线程池大小即并发上限，按批提交不会堆积）
+            if executor:
+                futures = [
+                    executor.submit(call_ai, api_key, model, r['amount'], r['total_assets'], exercises)
+                    for r in records
+                ]
+                for record, future in zip(records, futures):
+                    try:
+                        record.update(future.result())
+                        generated += 1
+                    except Exception:
+                        failed += 1
+
+            # 批量写入，按日期顺序把统计增量交给存储端原子合并（不整行覆盖，与前台生成并发也不丢更新）
+            old = storage.get_daily_records(user_id, days)
+            storage.upsert_daily_records(user_id, list(zip(days, records)))
+            deltas = []
+            for day, record in zip(days, records):
+                deltas.append(_stats_delta(day, record, old.get(day)))
+                old[day] = record
+            storage.apply_stats_deltas(user_id, deltas)
+
+            rows_done += len(days)
+            if progress:
+                progress(rows_done, time.perf_counter() - t0)
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+
+    seconds = time.perf_counter() - t0
+    return {
+        "rows": rows_done,
+        "generated": generated,
+        "failed": failed,
+        "final_assets": round(carry, 2) if carry is not None else None,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows_done / seconds, 1) if seconds > 0 else 0.0,
+    }
+
+
+def main():
+    import argparse
+    from .db import get_storage
+
+    parser = argparse.ArgumentParser(description="批量导入历史盈亏")
+    parser.add_argument("csv", help="CSV 文件路径")
+    parser.add_argument("--user", required=True, help="用户 ID")
+    parser.add_argument("--assets", type=float, default=None, help="起始本金（CSV 没有本金列时必填）")
+    parser.add_argument("--generate", action="store_true", help="为每天生成处方")
+    parser.add_argument("--api-key", default="", help="AI API 密钥")
+    parser.add_argument("--model", default="", help="AI 模型，默认取配置")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="生成并发数")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH_SIZE, help="每批写入行数")
+    args = parser.parse_args()
+
+    if not args.model:
+        from config import DEFAULT_MODEL
+        args.model = DEFAULT_MODEL
+
+    def report(rows, seconds):
+        print(f"\r已导入 {rows} 行，{rows / seconds if seconds else 0:.0f} 行/秒", end="", flush=True)
+
+    try:
+        result = backfill(
+            get_storage(), args.user, args.csv,
+            initial_assets=args.assets, generate=args.generate,
+            api_key=args.api_key, model=args.model,
+            concurrency=args.concurrency, batch_size=args.batch, progress=report
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    print()
+    print(f"完成：{result['rows']} 行，生成 {result['generated']}，失败 {result['failed']}，"
+          f"耗时 {result['seconds']}s（{result['rows_per_sec']} 行/秒），最终本金 {result['final_assets']}")
+
+
+if __name__ == "__main__":
+    main()
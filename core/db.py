@@ -1,31 +1,93 @@
 """
-数据库模块 - 处理 Supabase 数据存储（懒加载）
+数据库模块 - 处理用户数据存储（懒加载，后端可插拔）
 """
 
 import streamlit as st
 import os
-from datetime import date
+import re
+import threading
+import time
+from datetime import date, timedelta
+
+from .metrics import count_error, instrumented
 
 # 延迟导入，避免启动时加载 supabase
 _supabase_client = None
+_storage = None
+
+# 默认本地数据库路径
+DEFAULT_SQLITE_PATH = "stoic_leek.db"
+
+# 社区面板缓存时间（秒）
+COMMUNITY_CACHE_TTL = 30
+_community_cache = {}   # date -> (过期时间, 面板数据)
+_community_lock = threading.Lock()
+
+
+def _get_secret(name: str, default: str = "") -> str:
+    """读取配置：环境变量优先，其次 st.secrets"""
+    value = os.environ.get(name)
+    if value:
+        return value
+    try:
+        return st.secrets.get(name, default)
+    except Exception:
+        # 没有 secrets.toml 时 st.secrets 会抛异常
+        return default
+
+
+def create_supabase_client():
+    """新建一个 Supabase 客户端，未配置时返回 None
+
+    客户端登录后会记住用户的 token，认证相关操作应使用每个会话独立的客户端。
+    """
+    url = _get_secret("SUPABASE_URL")
+    key = _get_secret("SUPABASE_KEY")
+    
+    if url and key:
+        from supabase import create_client
+        return create_client(url, key)
+    
+    return None
 
 
 def get_supabase():
-    """获取 Supabase 客户端（懒加载单例）"""
+    """获取进程共享的 Supabase 客户端（懒加载单例，只用于数据读写，不在上面登录）"""
     global _supabase_client
     
-    if _supabase_client is not None:
-        return _supabase_client
+    if _supabase_client is None:
+        _supabase_client = create_supabase_client()
+    return _supabase_client
+
+
+def get_storage():
+    """获取存储后端（懒加载单例）
+
+    STORAGE_BACKEND 可选 supabase / sqlite；未指定时有 Supabase 配置则用 Supabase，
+    否则落到本地 SQLite（SQLITE_PATH），避免静默丢失数据。
+    """
+    global _storage
     
-    url = os.environ.get("SUPABASE_URL") or st.secrets.get("SUPABASE_URL", "")
-    key = os.environ.get("SUPABASE_KEY") or st.secrets.get("SUPABASE_KEY", "")
+    if _storage is not None:
+        return _storage
     
-    if url and key:
-        from supabase import create_client
-        _supabase_client = create_client(url, key)
-        return _supabase_client
+    from .storage import SQLiteStorage, SupabaseStorage
     
-    return None
+    backend = _get_secret("STORAGE_BACKEND").lower()
+    if backend != "sqlite":
+        supabase = get_supabase()
+        if supabase:
+            _storage = SupabaseStorage(supabase)
+            return _storage
+    
+    _storage = SQLiteStorage(_get_secret("SQLITE_PATH", DEFAULT_SQLITE_PATH))
+    return _storage
+
+
+def set_storage(storage):
+    """替换存储后端（测试或单机部署时注入）"""
+    global _storage
+    _storage = storage
 
 
 def _get_defaults():
@@ -39,10 +101,42 @@ def _today_str() -> str:
     return date.today().isoformat()
 
 
+# 用户设置中可由调用方写入的字段
+SETTINGS_FIELDS = ('api_key', 'exercises', 'model', 'model_name', 'total_assets')
+
+
+def get_user_settings(user_id: str) -> dict:
+    """读取用户设置（不依赖会话状态，失败时抛异常）
+
+    缺省项取默认值，result 为当天处方（没有则为 None）。
+    """
+    DEFAULT_EXERCISES, DEFAULT_MODEL, DEFAULT_MODEL_NAME = _get_defaults()
+    
+    data = get_storage().get_settings(user_id) or {}
+    today_record = data.get('today_record') if data.get('record_date') == _today_str() else None
+    return {
+        "exercises": data.get('exercises') or DEFAULT_EXERCISES.copy(),
+        "model": data.get('model') or DEFAULT_MODEL,
+        "model_name": data.get('model_name') or DEFAULT_MODEL_NAME,
+        "api_key": data.get('api_key') or "",
+        "total_assets": float(data['total_assets']) if data.get('total_assets') else None,
+        "result": today_record or None,
+    }
+
+
+def put_user_settings(user_id: str, settings: dict):
+    """写入用户设置（只写出现的字段，result 作为当天处方保存；失败时抛异常）"""
+    data = {"id": user_id, **{k: settings[k] for k in SETTINGS_FIELDS if k in settings}}
+    if settings.get('result') is not None:
+        data['today_record'] = settings['result']
+        data['record_date'] = _today_str()
+    get_storage().upsert_settings(data)
+
+
+@instrumented("load_user_data")
 def load_user_data(user_id: str):
-    """从数据库加载用户数据"""
+    """从数据库加载用户数据到会话状态"""
     DEFAULT_EXERCISES, DEFAULT_MODEL, DEFAULT_MODEL_NAME = _get_defaults()
-    supabase = get_supabase()
     
     # 设置默认值
     st.session_state.setdefault('exercises', DEFAULT_EXERCISES.copy())
@@ -52,58 +146,365 @@ def load_user_data(user_id: str):
     st.session_state.setdefault('total_assets', None)
     st.session_state.setdefault('page', 'home')
     
-    if not supabase or not user_id:
+    if not user_id:
         return
     
     try:
-        resp = supabase.table("user_settings").select("*").eq("id", user_id).execute()
-        if resp.data and len(resp.data) > 0:
-            data = resp.data[0]
-            if data.get('exercises'):
-                st.session_state['exercises'] = data['exercises']
-            if data.get('model'):
-                st.session_state['model'] = data['model']
-            if data.get('model_name'):
-                st.session_state['model_name'] = data['model_name']
-            if data.get('api_key'):
-                st.session_state['api_key'] = data['api_key']
-            if data.get('total_assets'):
-                st.session_state['total_assets'] = float(data['total_assets'])
-            
-            # 加载当天记录
-            record_date = data.get('record_date')
-            today_record = data.get('today_record')
-            if record_date == _today_str() and today_record:
-                st.session_state['result'] = today_record
+        settings = get_user_settings(user_id)
+        result = settings.pop('result')
+        st.session_state.update(settings)
+        # 加载当天记录
+        if result:
+            st.session_state['result'] = result
     except Exception as e:
+        count_error("load_user_data", e)
         st.session_state['db_error'] = str(e)
 
 
+@instrumented("save_user_data")
 def save_user_data(user_id: str) -> bool:
-    """保存用户数据到数据库"""
+    """把会话状态中的用户数据保存到数据库"""
     DEFAULT_EXERCISES, DEFAULT_MODEL, DEFAULT_MODEL_NAME = _get_defaults()
-    supabase = get_supabase()
     
-    if not supabase or not user_id:
+    if not user_id:
         return False
     
     try:
-        data = {
-            "id": user_id,
+        put_user_settings(user_id, {
             "api_key": st.session_state.get('api_key', ''),
             "exercises": st.session_state.get('exercises', DEFAULT_EXERCISES),
             "model": st.session_state.get('model', DEFAULT_MODEL),
             "model_name": st.session_state.get('model_name', DEFAULT_MODEL_NAME),
-            "total_assets": st.session_state.get('total_assets')
-        }
-        
-        # 如果有当天结果，也保存
-        if 'result' in st.session_state:
-            data['today_record'] = st.session_state['result']
-            data['record_date'] = _today_str()
-        
-        supabase.table("user_settings").upsert(data).execute()
+            "total_assets": st.session_state.get('total_assets'),
+            # 如果有当天结果，也保存
+            "result": st.session_state.get('result'),
+        })
+        return True
+    except Exception as e:
+        count_error("save_user_data", e)
+        st.session_state['db_error'] = str(e)
+        return False
+
+
+# ========== 每日记录（追加写 + 增量聚合）==========
+
+def _empty_stats() -> dict:
+    """空的用户聚合统计"""
+    return {
+        "streak": 0,
+        "last_date": None,
+        "total_days": 0,
+        "total_pnl": 0.0,
+        "mood_counts": {},
+        "exercise_counts": {},
+    }
+
+
+def _split_exercises(exercise: str) -> list[str]:
+    """拆分处方中的运动字符串"""
+    exercise = (exercise or "").strip()
+    if not exercise or exercise in ['0', '无', '休息', '休息日']:
+        return []
+    return [e.strip() for e in exercise.replace('，', ',').split(',') if e.strip() and e.strip() != '0']
+
+
+def _bump(counts: dict, key: str, delta: int):
+    """计数器增减，归零时删除"""
+    if not key:
+        return
+    n = counts.get(key, 0) + delta
+    if n > 0:
+        counts[key] = n
+    else:
+        counts.pop(key, None)
+
+
+def _count(counts: dict, key: str, delta: int):
+    """累加增量（不删除归零的键）"""
+    if key:
+        counts[key] = counts.get(key, 0) + delta
+
+
+def _stats_delta(day: str, record: dict, old_record: dict | None = None) -> dict:
+    """一条每日记录对聚合统计的增量（同日覆盖时扣除旧记录）"""
+    pnl = float(record.get('amount', 0))
+    moods, exercises = {}, {}
+    if old_record:
+        pnl -= float(old_record.get('amount', 0))
+        _count(moods, old_record.get('mood'), -1)
+        for ex in _split_exercises(old_record.get('exercise', '')):
+            _count(exercises, ex, -1)
+    _count(moods, record.get('mood'), 1)
+    for ex in _split_exercises(record.get('exercise', '')):
+        _count(exercises, ex, 1)
+    return {
+        "day": day,
+        "new_day": 0 if old_record else 1,
+        "pnl": round(pnl, 2),
+        "moods": {k: n for k, n in moods.items() if n},
+        "exercises": {k: n for k, n in exercises.items() if n},
+    }
+
+
+def _apply_delta(stats: dict | None, delta: dict) -> dict:
+    """把增量合并进聚合统计（与 apply_user_stats_delta 数据库函数逻辑一致）"""
+    stats = {**_empty_stats(), **(stats or {})}
+    stats['mood_counts'] = dict(stats['mood_counts'])
+    stats['exercise_counts'] = dict(stats['exercise_counts'])
+    
+    stats['total_days'] += delta['new_day']
+    stats['total_pnl'] = round(float(stats['total_pnl']) + delta['pnl'], 2)
+    for key, n in delta['moods'].items():
+        _bump(stats['mood_counts'], key, n)
+    for key, n in delta['exercises'].items():
+        _bump(stats['exercise_counts'], key, n)
+    
+    # 连续打卡：只在新的一天推进
+    day, last = delta['day'], stats['last_date']
+    if last is None or day > last:
+        yesterday = (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+        stats['streak'] = stats['streak'] + 1 if last == yesterday else 1
+        stats['last_date'] = day
+    
+    return stats
+
+
+def write_daily_record(user_id: str, record: dict, day: str | None = None):
+    """写入某天的处方记录并同步更新聚合统计（不依赖会话状态，失败时抛异常）"""
+    day = day or _today_str()
+    storage = get_storage()
+    old_record = storage.get_daily_record(user_id, day)
+    storage.upsert_daily_record(user_id, day, record)
+    
+    # 统计只提交增量，由存储端原子合并，并发写入不会互相覆盖
+    storage.apply_stats_delta(user_id, _stats_delta(day, record, old_record))
+    
+    # 社区计数：同日重新生成只记差值，不重复计数
+    deltas = _community_deltas(record, old_record)
+    if deltas:
+        storage.increment_counters(day, deltas)
+
+
+def save_daily_record(user_id: str, record: dict, day: str | None = None) -> bool:
+    """写入某天的处方记录，并同步更新用户聚合统计"""
+    if not user_id:
+        return False
+    
+    try:
+        write_daily_record(user_id, record, day)
         return True
     except Exception as e:
         st.session_state['db_error'] = str(e)
         return False
+
+
+def list_daily_records(user_id: str, before: str | None = None, limit: int = 30) -> tuple[list[dict], str | None]:
+    """按日期倒序分页读取历史记录，返回 (记录列表, 下一页游标)"""
+    if not user_id:
+        return [], None
+    
+    try:
+        rows = get_storage().list_daily_records(user_id, before, limit)
+        cursor = rows[-1]['date'] if len(rows) == limit else None
+        return rows, cursor
+    except Exception as e:
+        st.session_state['db_error'] = str(e)
+        return [], None
+
+
+def _load_stats(user_id: str) -> dict:
+    """读取聚合统计并补齐缺省字段（失败时抛异常）"""
+    data = get_storage().get_stats(user_id)
+    if not data:
+        return _empty_stats()
+    return {k: data.get(k, v) if data.get(k) is not None else v for k, v in _empty_stats().items()}
+
+
+def load_user_stats(user_id: str) -> dict:
+    """读取用户聚合统计（O(1)，不扫描历史）"""
+    if not user_id:
+        return _empty_stats()
+    
+    try:
+        return _load_stats(user_id)
+    except Exception as e:
+        st.session_state['db_error'] = str(e)
+    return _empty_stats()
+
+
+# ========== 社区面板（全站当日计数器）==========
+
+def _exercise_name(item: str) -> str:
+    """去掉数量等后缀，只保留动作名（如 "深蹲 20 个" -> "深蹲"）"""
+    return re.split(r'[\s\d×xX*（(]', item.strip(), maxsplit=1)[0] or item.strip()
+
+
+def _community_keys(record: dict) -> list[tuple[str, str]]:
+    """一条记录对应的社区计数键"""
+    from config import MOOD_KEYWORDS, volatility_level
+    
+    mood = record.get('mood') or ''
+    keys = [
+        ("mood", mood if mood in MOOD_KEYWORDS else "其他"),
+        ("tier", volatility_level(float(record.get('roi', 0)))),
+    ]
+    keys += [("exercise", _exercise_name(ex)) for ex in _split_exercises(record.get('exercise', ''))]
+    return keys
+
+
+def _community_deltas(record: dict, old_record: dict | None = None) -> dict[tuple[str, str], int]:
+    """新记录相对旧记录的计数增量（抵消后为 0 的键会被去掉）"""
+    deltas = {}
+    for key in _community_keys(record):
+        deltas[key] = deltas.get(key, 0) + 1
+    if old_record:
+        for key in _community_keys(old_record):
+            deltas[key] = deltas.get(key, 0) - 1
+    return {k: v for k, v in deltas.items() if v}
+
+
+def load_community_panel(day: str | None = None, top_n: int = 5) -> dict:
+    """读取"今日众生相"面板数据（进程级缓存 COMMUNITY_CACHE_TTL 秒）"""
+    day = day or _today_str()
+    now = time.monotonic()
+    with _community_lock:
+        cached = _community_cache.get(day)
+        if cached and cached[0] > now:
+            return cached[1]
+    
+    try:
+        counters = get_storage().get_counters(day)
+    except Exception:
+        counters = {}
+    
+    exercises = counters.get("exercise", {})
+    panel = {
+        "date": day,
+        "users": sum(counters.get("tier", {}).values()),
+        "moods": dict(sorted(counters.get("mood", {}).items(), key=lambda kv: -kv[1])),
+        "tiers": counters.get("tier", {}),
+        "top_exercises": sorted(exercises.items(), key=lambda kv: -kv[1])[:top_n],
+    }
+    with _community_lock:
+        _community_cache.clear()
+        _community_cache[day] = (now + COMMUNITY_CACHE_TTL, panel)
+    return panel
+
+
+# ========== 数据导出（键集分页 + 流式写出）==========
+
+# 每页读取的用户数
+EXPORT_PAGE_SIZE = 500
+
+
+def iter_settings_pages(after: str | None = None, page_size: int = EXPORT_PAGE_SIZE,
+                        include_api_key: bool = False):
+    """按 id 键集分页逐页产出用户设置（内存中只保留一页）"""
+    storage = get_storage()
+    while True:
+        rows = storage.list_settings(after, page_size)
+        if not include_api_key:
+            for row in rows:
+                row.pop('api_key', None)
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        after = rows[-1]['id']
+
+
+def iter_user_settings(after: str | None = None, page_size: int = EXPORT_PAGE_SIZE,
+                       include_api_key: bool = False):
+    """逐行产出用户设置"""
+    for page in iter_settings_pages(after, page_size, include_api_key):
+        yield from page
+
+
+def _read_checkpoint(path: str) -> dict | None:
+    """读取导出断点"""
+    import json
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_checkpoint(path: str, checkpoint: dict):
+    """原子写入导出断点"""
+    import json
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def export_user_settings(path: str, include_api_key: bool = False, checkpoint: str | None = None,
+                         page_size: int = EXPORT_PAGE_SIZE, progress=None) -> dict:
+    """把所有用户设置导出为 NDJSON（路径以 .gz 结尾时 gzip 压缩）
+
+    每页写完后记录断点 {last_id, rows, offset}；指定 checkpoint 且断点存在时，
+    先把输出文件截断到断点位置（丢弃中断时写了一半的页），再从 last_id 之后继续。
+    gzip 输出每页一个独立成员，拼接后仍是合法的 gzip 文件。
+    progress(rows, seconds) 每页写入后回调一次。
+    """
+    import gzip
+    import json
+    
+    state = (_read_checkpoint(checkpoint) if checkpoint else None) or {"last_id": None, "rows": 0, "offset": 0}
+    compress = path.endswith('.gz')
+    resumed_rows = state['rows']
+    t0 = time.perf_counter()
+    
+    with open(path, 'r+b' if state['offset'] else 'wb') as f:
+        f.truncate(state['offset'])
+        f.seek(state['offset'])
+        for page in iter_settings_pages(state['last_id'], page_size, include_api_key):
+            data = ''.join(json.dumps(row, ensure_ascii=False, default=str) + '\n' for row in page).encode('utf-8')
+            f.write(gzip.compress(data) if compress else data)
+            f.flush()
+            
+            state = {"last_id": page[-1]['id'], "rows": state['rows'] + len(page), "offset": f.tell()}
+            if checkpoint:
+                _write_checkpoint(checkpoint, state)
+            if progress:
+                progress(state['rows'] - resumed_rows, time.perf_counter() - t0)
+    
+    seconds = time.perf_counter() - t0
+    rows = state['rows'] - resumed_rows
+    return {
+        "rows": rows,
+        "total_rows": state['rows'],
+        "bytes": state['offset'],
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else 0.0,
+    }
+
+
+def main():
+    """命令行导出：python -m core.db export users.ndjson.gz [--with-api-key] [--checkpoint ckpt.json]"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="导出用户数据")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="导出 user_settings 为 NDJSON（.gz 结尾则压缩）")
+    export.add_argument("output", help="输出文件路径")
+    export.add_argument("--with-api-key", action="store_true", help="包含 API 密钥（默认不导出）")
+    export.add_argument("--checkpoint", help="断点文件，存在时从断点继续")
+    export.add_argument("--page", type=int, default=EXPORT_PAGE_SIZE, help="每页行数")
+    args = parser.parse_args()
+    
+    def report(rows, seconds):
+        print(f"\r已导出 {rows} 行，{rows / seconds if seconds else 0:.0f} 行/秒", end="", flush=True)
+    
+    result = export_user_settings(
+        args.output, include_api_key=args.with_api_key,
+        checkpoint=args.checkpoint, page_size=args.page, progress=report
+    )
+    print()
+    print(f"完成：本次 {result['rows']} 行（累计 {result['total_rows']}），{result['bytes']} 字节，"
+          f"耗时 {result['seconds']}s（{result['rows_per_sec']} 行/秒）")
+
+
+if __name__ == "__main__":
+    main()
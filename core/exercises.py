@@ -0,0 +1,129 @@
+"""
+动作池模块 - 带标签索引的有序动作池，按波动等级抽取有限子集放进 Prompt
+"""
+
+import random
+from functools import lru_cache
+
+# 每个波动等级优先的强度（按顺序）和最多放进 Prompt 的动作数
+TIER_PLAN = {
+    "死水区": (("低",), 3),
+    "涟漪区": (("低", "中"), 6),
+    "浪潮区": (("中", "高"), 8),
+    "海啸区": (("高", "中"), 10),
+}
+INTENSITIES = ("低", "中", "高")
+
+# 自定义动作没有配置标签时按关键词推断（按顺序匹配）
+_PART_KEYWORDS = (
+    ("核心", ("腹", "平板", "卷", "核心", "俄罗斯转体", "登山")),
+    ("腿", ("蹲", "腿", "弓步", "臀", "提踵")),
+    ("上肢", ("俯卧撑", "引体", "臂", "肩", "推", "划船", "哑铃")),
+    ("有氧", ("跑", "跳", "踏", "有氧", "单车", "游泳")),
+)
+_INTENSITY_KEYWORDS = (
+    ("高", ("波比", "冲刺", "力竭", "跳", "HIIT", "爆发")),
+    ("低", ("拉伸", "瑜伽", "散步", "冥想", "呼吸", "放松")),
+)
+
+
+@lru_cache(maxsize=4096)
+def infer_tags(name: str) -> tuple[str, str]:
+    """按关键词推断 (强度, 部位)，推断不出时为 (中, 全身)"""
+    intensity = next((level for level, words in _INTENSITY_KEYWORDS if any(w in name for w in words)), "中")
+    part = next((part for part, words in _PART_KEYWORDS if any(w in name for w in words)), "全身")
+    return intensity, part
+
+
+def _configured_tags() -> dict:
+    """读取配置里的动作标签（懒加载）"""
+    from config import EXERCISE_TAGS
+    return {name: tuple(tags) for name, tags in EXERCISE_TAGS.items()}
+
+
+class ExercisePool:
+    """有序动作池：O(1) 判重和删除，并按 强度 -> 部位 建立索引"""
+
+    __slots__ = ("_tags", "_index", "_known")
+
+    def __init__(self, names=(), tags: dict | None = None):
+        self._tags = {}     # 名称 -> (强度, 部位)，dict 保持插入顺序
+        self._index = {}    # 强度 -> 部位 -> {名称: None}
+        self._known = _configured_tags() if tags is None else tags
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str, tags: tuple[str, str] | None = None) -> bool:
+        """添加动作，已存在返回 False"""
+        if name in self._tags:
+            return False
+        tags = tags or self._known.get(name) or infer_tags(name)
+        self._tags[name] = tags
+        self._index.setdefault(tags[0], {}).setdefault(tags[1], {})[name] = None
+        return True
+
+    def remove(self, name: str) -> bool:
+        """删除动作，不存在返回 False"""
+        tags = self._tags.pop(name, None)
+        if tags is None:
+            return False
+        parts = self._index[tags[0]]
+        del parts[tags[1]][name]
+        if not parts[tags[1]]:
+            del parts[tags[1]]
+        return True
+
+    def tags(self, name: str) -> tuple[str, str] | None:
+        """动作的 (强度, 部位)"""
+        return self._tags.get(name)
+
+    def by_intensity(self, intensity: str) -> dict[str, dict]:
+        """某个强度下按部位分组的动作"""
+        return self._index.get(intensity, {})
+
+    def names(self) -> list[str]:
+        """按添加顺序返回动作列表（用于保存）"""
+        return list(self._tags)
+
+    def __contains__(self, name) -> bool:
+        return name in self._tags
+
+    def __iter__(self):
+        return iter(self._tags)
+
+    def __len__(self) -> int:
+        return len(self._tags)
+
+
+def _round_robin(groups: list[list[str]], limit: int) -> list[str]:
+    """在各组之间轮流取，直到取满 limit"""
+    picked = []
+    while groups and len(picked) < limit:
+        for group in groups:
+            if group and len(picked) < limit:
+                picked.append(group.pop())
+        groups = [g for g in groups if g]
+    return picked
+
+
+def sample_exercises(exercises, tier: str, limit: int | None = None, rng=random) -> list[str]:
+    """按波动等级从动作池抽取有限子集
+
+    优先该等级对应强度的动作，并在部位之间轮流挑选保证多样性，不够时用其余强度补齐。
+    动作池不超过上限时原样返回，Prompt 大小与动作池总量无关。
+    """
+    pool = exercises if isinstance(exercises, ExercisePool) else ExercisePool(exercises)
+    preferred, default_limit = TIER_PLAN.get(tier, (INTENSITIES, 10))
+    limit = limit or default_limit
+    if len(pool) <= limit:
+        return pool.names()
+
+    picked = []
+    order = list(preferred) + [level for level in INTENSITIES if level not in preferred]
+    for level in order:
+        groups = [rng.sample(list(names), min(len(names), limit)) for names in pool.by_intensity(level).values()]
+        rng.shuffle(groups)
+        picked += _round_robin(groups, limit - len(picked))
+        if len(picked) >= limit:
+            break
+    return picked
@@ -0,0 +1,221 @@
+"""
+指标模块 - 热点路径的延迟直方图、错误计数和并发数，导出为 Prometheus 文本格式
+"""
+
+import bisect
+import functools
+import threading
+import time
+
+# 延迟直方图桶（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_PREFIX = "stoic_leek"
+
+_lock = threading.Lock()
+_histograms = {}   # (op, labels) -> [各桶计数..., +Inf 计数, 总耗时]
+_errors = {}       # (op, labels, 异常类型) -> 次数
+_inflight = {}     # (op, labels) -> 当前并发数
+_gauges = {}       # (name, labels) -> 值
+_counters = {}     # (name, labels) -> 累计值
+_exporter_started = False
+
+
+def _key(op: str, labels: dict) -> tuple:
+    """生成指标键"""
+    return (op, tuple(sorted(labels.items())))
+
+
+def observe(op: str, seconds: float, **labels):
+    """记录一次耗时"""
+    key = _key(op, labels)
+    idx = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        hist[idx] += 1
+        hist[-1] += seconds
+
+
+def count_error(op: str, error: BaseException, **labels):
+    """按异常类型计数"""
+    key = _key(op, labels) + (type(error).__name__,)
+    with _lock:
+        _errors[key] = _errors.get(key, 0) + 1
+
+
+def set_gauge(name: str, value: float, **labels):
+    """设置通用 gauge"""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def inc(name: str, value: float = 1, **labels):
+    """通用计数器累加"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class timed:
+    """计时上下文：记录耗时、并发数，异常时按类型计数
+
+    用法：
+        with timed("call_ai", model=model):
+            ...
+    """
+
+    __slots__ = ("op", "labels", "key", "start")
+
+    def __init__(self, op: str, **labels):
+        self.op = op
+        self.labels = labels
+        self.key = _key(op, labels)
+
+    def __enter__(self):
+        with _lock:
+            _inflight[self.key] = _inflight.get(self.key, 0) + 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.op, time.perf_counter() - self.start, **self.labels)
+        with _lock:
+            _inflight[self.key] -= 1
+        if exc is not None:
+            count_error(self.op, exc, **self.labels)
+        return False
+
+
+def instrumented(op: str):
+    """函数装饰器版 timed"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(op):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _escape(value) -> str:
+    """转义标签值"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _fmt_labels(op: str, labels: tuple, *extra: tuple) -> str:
+    """格式化标签"""
+    pairs = [("op", op), *labels, *extra]
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _render_simple(lines: list, values: dict, metric_type: str):
+    """导出通用 gauge / counter"""
+    seen = set()
+    for (name, labels), value in sorted(values.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {_PREFIX}_{name} {metric_type}")
+            seen.add(name)
+        label_str = "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}" if labels else ""
+        lines.append(f"{_PREFIX}_{name}{label_str} {value}")
+
+
+def render_prometheus() -> str:
+    """导出 Prometheus 文本格式"""
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        errors = dict(_errors)
+        inflight = dict(_inflight)
+        gauges = dict(_gauges)
+        counters = dict(_counters)
+
+    lines = [
+        f"# HELP {_PREFIX}_op_duration_seconds Latency of hot-path operations.",
+        f"# TYPE {_PREFIX}_op_duration_seconds histogram",
+    ]
+    for (op, labels), hist in sorted(histograms.items()):
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ("+Inf",), hist[:-1]):
+            cumulative += n
+            lines.append(f"{_PREFIX}_op_duration_seconds_bucket{_fmt_labels(op, labels, ('le', bound))} {cumulative}")
+        lines.append(f"{_PREFIX}_op_duration_seconds_sum{_fmt_labels(op, labels)} {hist[-1]:.6f}")
+        lines.append(f"{_PREFIX}_op_duration_seconds_count{_fmt_labels(op, labels)} {cumulative}")
+
+    lines += [
+        f"# HELP {_PREFIX}_op_errors_total Errors of hot-path operations by exception type.",
+        f"# TYPE {_PREFIX}_op_errors_total counter",
+    ]
+    for (op, labels, err_type), n in sorted(errors.items()):
+        lines.append(f"{_PREFIX}_op_errors_total{_fmt_labels(op, labels, ('type', err_type))} {n}")
+
+    lines += [
+        f"# HELP {_PREFIX}_op_inflight Operations currently in flight.",
+        f"# TYPE {_PREFIX}_op_inflight gauge",
+    ]
+    for (op, labels), n in sorted(inflight.items()):
+        lines.append(f"{_PREFIX}_op_inflight{_fmt_labels(op, labels)} {n}")
+
+    _render_simple(lines, gauges, "gauge")
+    _render_simple(lines, counters, "counter")
+    return "\n".join(lines) + "\n"
+
+
+def _serve(host: str, port: int):
+    """本地 HTTP 端点：GET /metrics"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer((host, port), Handler).serve_forever()
+
+
+def _write_loop(path: str, interval: float):
+    """定期把指标写入文件（先写临时文件再替换，避免读到半截内容）"""
+    import os
+    while True:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+        os.replace(tmp, path)
+        time.sleep(interval)
+
+
+def start_exporter() -> bool:
+    """按配置启动导出（每个进程一次）
+
+    METRICS_PORT：在 METRICS_HOST（默认 127.0.0.1）上提供 /metrics
+    METRICS_FILE：每 METRICS_INTERVAL 秒（默认 15）写一次文本文件
+    """
+    global _exporter_started
+    from .db import _get_secret
+
+    with _lock:
+        if _exporter_started:
+            return False
+        _exporter_started = True
+
+    port = _get_secret("METRICS_PORT")
+    if port:
+        host = _get_secret("METRICS_HOST", "127.0.0.1")
+        threading.Thread(target=_serve, args=(host, int(port)), name="metrics-http", daemon=True).start()
+
+    path = _get_secret("METRICS_FILE")
+    if path:
+        interval = float(_get_secret("METRICS_INTERVAL", "15"))
+        threading.Thread(target=_write_loop, args=(path, interval), name="metrics-file", daemon=True).start()
+
+    return bool(port or path)
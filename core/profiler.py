@@ -0,0 +1,132 @@
+"""
+性能剖析模块 - 按环境变量开启，对每次脚本重跑做 cProfile / tracemalloc 采样
+
+PROFILE：cprofile、tracemalloc 或两者（逗号分隔），为空则关闭
+PROFILE_SAMPLE：采样比例，0~1，默认 1
+PROFILE_DIR：输出目录，默认 profiles/
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import streamlit as st
+
+from .db import _get_secret
+
+# 每次剖析保留的内存分配热点数
+TOP_ALLOCATIONS = 10
+
+# tracemalloc 是进程级的，同一时刻只允许一次重跑采样内存，其余并发的重跑跳过
+_trace_lock = threading.Lock()
+
+
+def _settings() -> tuple[set, float, Path]:
+    """读取剖析配置"""
+    modes = {m.strip().lower() for m in _get_secret("PROFILE").split(',') if m.strip()}
+    if modes & {"1", "true", "yes"}:
+        modes = {"cprofile"}
+    rate = float(_get_secret("PROFILE_SAMPLE", "1") or 1)
+    return modes & {"cprofile", "tracemalloc"}, rate, Path(_get_secret("PROFILE_DIR", "profiles"))
+
+
+def _trigger() -> str:
+    """推断本次重跑的触发方式：首次加载 / st.rerun() / 控件交互"""
+    if not st.session_state.get('_profile_seen'):
+        st.session_state['_profile_seen'] = True
+        return "load"
+    if st.session_state.pop('_profile_rerun', False):
+        return "rerun"
+    return "widget"
+
+
+def _start_tracing() -> bool:
+    """独占开启 tracemalloc；已有其它重跑在采样（或外部已开启）时返回 False"""
+    import tracemalloc
+    if not _trace_lock.acquire(blocking=False):
+        return False
+    if tracemalloc.is_tracing():
+        _trace_lock.release()
+        return False
+    tracemalloc.start()
+    return True
+
+
+def _stop_tracing(summary: dict):
+    """采集内存峰值和分配热点后关闭 tracemalloc 并释放名额"""
+    import tracemalloc
+    try:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        _trace_lock.release()
+    summary["mem_peak_kb"] = round(peak / 1024, 1)
+    summary["top_alloc"] = [
+        [f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", round(stat.size / 1024, 1)]
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+    ]
+
+
+def _write(out_dir: Path, summary: dict, profiler):
+    """写出 .prof 文件并追加索引"""
+    try:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        if profiler:
+            profiler.dump_stats(out_dir / f"{summary['id']}.prof")
+        with open(out_dir / "index.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+@contextmanager
+def profile_run():
+    """剖析一次脚本执行；yield 的 dict 可由调用方补充标签（如 page）"""
+    modes, rate, out_dir = _settings()
+    tags = {}
+    if not modes:
+        yield tags
+        return
+
+    tags['trigger'] = _trigger()
+    sampled = random.random() < rate
+    profiler = None
+    if sampled and "cprofile" in modes:
+        import cProfile
+        profiler = cProfile.Profile()
+    tracing = sampled and "tracemalloc" in modes and _start_tracing()
+
+    t0 = time.perf_counter()
+    outcome = "ok"
+    if profiler:
+        profiler.enable()
+    try:
+        yield tags
+    except BaseException as e:
+        # st.rerun() / st.stop() 通过异常结束脚本
+        outcome = type(e).__name__
+        if outcome == "RerunException":
+            st.session_state['_profile_rerun'] = True
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        if sampled:
+            summary = {
+                "id": f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}",
+                "page": tags.get('page', '-'),
+                "trigger": tags['trigger'],
+                "outcome": outcome,
+                "wall_ms": round((time.perf_counter() - t0) * 1000, 2),
+            }
+            if tracing:
+                _stop_tracing(summary)
+            elif "tracemalloc" in modes:
+                summary["mem_skipped"] = True
+            _write(out_dir, summary, profiler)
@@ -0,0 +1,122 @@
+"""
+会话模块 - 估算每个会话的内存占用，并裁剪空闲会话里可重建的大对象
+"""
+
+import sys
+import threading
+import time
+
+from .db import _get_secret
+from .metrics import inc, set_gauge
+
+# 可重建的大对象：空闲时丢弃，再次访问时自动重建
+HEAVY_KEYS = ('card_bytes', 'card_key')
+
+# 空闲会话扫描间隔（秒）
+SWEEP_INTERVAL = 60
+
+_lock = threading.Lock()
+_sessions = {}      # session_id -> [会话状态, 最近活跃时间, 估算字节数]
+_last_sweep = 0.0
+
+
+def estimate_size(obj, _seen: set | None = None) -> int:
+    """递归估算对象占用字节数（展开 dict/list/tuple/set，其余只算自身）"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(v, _seen) for v in obj)
+    return size
+
+
+def _idle_seconds() -> float:
+    """空闲多久后裁剪（SESSION_IDLE_SECONDS，默认 600）"""
+    return float(_get_secret("SESSION_IDLE_SECONDS", "600"))
+
+
+def _trim(state) -> int:
+    """丢弃会话里的大对象，返回释放的估算字节数"""
+    freed = 0
+    for key in HEAVY_KEYS:
+        if key in state:
+            freed += estimate_size(state[key])
+            del state[key]
+    return freed
+
+
+def _session_alive(session_id: str) -> bool | None:
+    """通过 Runtime 的会话管理器判断会话是否还在；没有 Runtime（AppTest / 裸跑）时返回 None"""
+    from streamlit.runtime import Runtime
+    if not Runtime.exists():
+        return None
+    # AppTest 下 Runtime 是 Mock，没有会话管理器
+    manager = getattr(Runtime.instance(), '_session_mgr', None)
+    if manager is None:
+        return None
+    return manager.get_session_info(session_id) is not None
+
+
+def _sweep(now: float):
+    """裁剪空闲会话，并更新会话内存指标"""
+    with _lock:
+        entries = list(_sessions.items())
+    
+    idle = _idle_seconds()
+    total = peak = active = 0
+    for session_id, entry in entries:
+        alive = _session_alive(session_id)
+        if alive is False:
+            # 会话已关闭
+            with _lock:
+                _sessions.pop(session_id, None)
+            continue
+        if now - entry[1] > idle:
+            freed = _trim(entry[0])
+            if freed:
+                entry[2] = max(entry[2] - freed, 0)
+                inc("session_trimmed_total")
+                inc("session_trimmed_bytes_total", freed)
+            if alive is None:
+                # 无法确认会话是否还在：裁剪后不再持有，再次访问时会重新登记
+                with _lock:
+                    _sessions.pop(session_id, None)
+                continue
+        active += 1
+        total += entry[2]
+        peak = max(peak, entry[2])
+    
+    set_gauge("sessions", active)
+    set_gauge("session_memory_bytes", total, stat="total")
+    set_gauge("session_memory_bytes", peak, stat="max")
+
+
+def track_session() -> int | None:
+    """登记当前会话的活跃时间和内存估算，定期裁剪空闲会话；返回当前会话估算字节数"""
+    global _last_sweep
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None
+    
+    # ctx.session_state 是每次执行的包装，执行结束即失效；登记底层的 SessionState，
+    # 它与会话同生命周期，会话是否关闭由 Runtime 的会话管理器判断
+    state = ctx.session_state._state
+    size = estimate_size(ctx.session_state.filtered_state)
+    now = time.monotonic()
+    with _lock:
+        _sessions[ctx.session_id] = [state, now, size]
+        due = now - _last_sweep >= SWEEP_INTERVAL
+        if due:
+            _last_sweep = now
+    
+    if due:
+        _sweep(now)
+    return size
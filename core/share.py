@@ -4,15 +4,24 @@
 
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 import os
 
+from .metrics import instrumented
+
 # 分享链接
 SHARE_URL = "https://github.com/Dxboy266/The-Stoic-Leek"
+QR_SIZE = 48
+
 
+# 卡片用到的字号，预热时一次性加载
+FONT_SIZES = (12, 14, 17, 26, 40, 50)
 
+
+@lru_cache(maxsize=16)
 def _get_font(size: int):
-    """获取字体"""
+    """获取字体（按字号缓存）"""
     font_paths = [
         "C:/Windows/Fonts/msyh.ttc",
         "C:/Windows/Fonts/simhei.ttf",
@@ -85,8 +94,9 @@ def _parse_exercises(exercise_str: str) -> list:
     return [e.strip() for e in exercises if e.strip() and e.strip() != '0']
 
 
+@lru_cache(maxsize=8)
 def _generate_qrcode(url: str, size: int, dark_mode: bool = False) -> Image.Image:
-    """生成二维码"""
+    """生成二维码（缓存，调用方只读不改）"""
     try:
         import qrcode
         qr = qrcode.QRCode(
@@ -112,6 +122,66 @@ def _generate_qrcode(url: str, size: int, dark_mode: bool = False) -> Image.Imag
         return placeholder
 
 
+# A股双皮肤配色，键为是否亏损
+THEMES = {
+    # 【韭菜护眼版】关灯吃面 - 赛博朋克风
+    True: {
+        'gradient_top': (10, 25, 47),       # 深蓝
+        'gradient_bottom': (5, 15, 25),     # 更深的蓝黑
+        'text_primary': (255, 255, 255),    # 白色
+        'text_secondary': (160, 180, 200),  # 浅银蓝
+        'accent': (0, 255, 100),            # 荧光绿
+        'card': (20, 40, 60),               # 深蓝灰
+        'card_alpha': 180,
+        'quote': (40, 60, 80),
+        'divider': (40, 60, 80),
+    },
+    # 【红红火火版】喜庆温暖
+    False: {
+        'gradient_top': (255, 245, 238),    # 极淡暖橙
+        'gradient_bottom': (255, 255, 255), # 白色
+        'text_primary': (51, 51, 51),       # 深灰
+        'text_secondary': (128, 128, 128),  # 灰色
+        'accent': (255, 51, 51),            # 正红色
+        'card': (255, 250, 245),            # 暖白
+        'card_alpha': 220,
+        'quote': (255, 230, 220),
+        'divider': (240, 230, 225),
+    },
+}
+
+
+def _draw_footer(img: Image.Image, draw, y: int, padding: int, theme: dict, dark_mode: bool):
+    """绘制底部署名和二维码"""
+    width = img.size[0]
+    draw.line([(padding, y), (width - padding, y)], fill=theme['divider'], width=1)
+    y += 14
+    
+    draw.text((padding, y), "韭菜的自我修养", font=_get_font(14), fill=theme['text_primary'])
+    draw.text((padding, y + 20), "The Stoic Leek", font=_get_font(12), fill=theme['text_secondary'])
+    
+    # 二维码
+    qr_img = _generate_qrcode(SHARE_URL, QR_SIZE, dark_mode=dark_mode)
+    img.paste(qr_img, (width - padding - QR_SIZE, y + 3))
+
+
+def _to_png(img: Image.Image) -> bytes:
+    """输出 PNG 字节"""
+    buffer = BytesIO()
+    img.save(buffer, format='PNG', quality=95)
+    buffer.seek(0)
+    return buffer.getvalue()
+
+
+def preload_assets():
+    """预加载字体和二维码（供预热使用）"""
+    for size in FONT_SIZES:
+        _get_font(size)
+    for dark_mode in (False, True):
+        _generate_qrcode(SHARE_URL, QR_SIZE, dark_mode)
+
+
+@instrumented("generate_share_card")
 def generate_share_card(amount: float, roi: float, exercise: str, advice: str, quote: str = "") -> bytes:
     """生成分享卡片图片 - A股风格双皮肤"""
     
@@ -121,29 +191,11 @@ def generate_share_card(amount: float, roi: float, exercise: str, advice: str, q
     
     # 根据盈亏选择主题
     is_loss = amount < 0
-    
-    if is_loss:
-        # 【韭菜护眼版】关灯吃面 - 赛博朋克风
-        gradient_top = (10, 25, 47)      # 深蓝
-        gradient_bottom = (5, 15, 25)    # 更深的蓝黑
-        text_primary = (255, 255, 255)   # 白色
-        text_secondary = (160, 180, 200) # 浅银蓝
-        accent_color = (0, 255, 100)     # 荧光绿
-        card_color = (20, 40, 60)        # 深蓝灰
-        card_alpha = 180
-        quote_color = (40, 60, 80)
-        divider_color = (40, 60, 80)
-    else:
-        # 【红红火火版】喜庆温暖
-        gradient_top = (255, 245, 238)   # 极淡暖橙
-        gradient_bottom = (255, 255, 255) # 白色
-        text_primary = (51, 51, 51)      # 深灰
-        text_secondary = (128, 128, 128) # 灰色
-        accent_color = (255, 51, 51)     # 正红色
-        card_color = (255, 250, 245)     # 暖白
-        card_alpha = 220
-        quote_color = (255, 230, 220)
-        divider_color = (240, 230, 225)
+    theme = THEMES[is_loss]
+    gradient_top, gradient_bottom = theme['gradient_top'], theme['gradient_bottom']
+    text_primary, text_secondary = theme['text_primary'], theme['text_secondary']
+    accent_color, card_color, card_alpha = theme['accent'], theme['card'], theme['card_alpha']
+    quote_color = theme['quote']
     
     # 字体
     font_title = _get_font(26)
@@ -252,21 +304,167 @@ def generate_share_card(amount: float, roi: float, exercise: str, advice: str, q
     y = card_y2 + 16
     
     # ===== 底部 =====
-    draw.line([(padding, y), (width - padding, y)], fill=divider_color, width=1)
-    y += 14
+    _draw_footer(img, draw, y, padding, theme, is_loss)
     
-    draw.text((padding, y), "韭菜的自我修养", font=font_small, fill=text_primary)
-    draw.text((padding, y + 20), "The Stoic Leek", font=font_tiny, fill=text_secondary)
+    return _to_png(img)
+
+
+# ========== 日历热力图 ==========
+
+# |ROI| 达到该值（%）时格子颜色最深
+HEATMAP_ROI_SCALE = 5.0
+# 涨红跌绿
+HEATMAP_UP = (255, 51, 51)
+HEATMAP_DOWN = (0, 200, 90)
+
+
+def _heatmap_colors(roi, volume, theme: dict):
+    """一次性计算所有格子的底色和运动量条颜色（N x 3）"""
+    import numpy as np
+    
+    has = ~np.isnan(roi)
+    roi = np.nan_to_num(roi)
+    base = np.array(theme['card'], dtype=float)
+    empty = np.array(theme['quote'], dtype=float)
+    
+    # 有记录的格子至少带 25% 色调，|ROI| 越大颜色越深
+    t = 0.25 + 0.75 * np.clip(np.abs(roi) / HEATMAP_ROI_SCALE, 0, 1)
+    target = np.where((roi > 0)[:, None], HEATMAP_UP, HEATMAP_DOWN)
+    colors = base + (target - base) * t[:, None]
+    colors[has & (roi == 0)] = np.array(theme['text_secondary'], dtype=float)
+    colors[~has] = empty
+    
+    # 运动量：按当期最大值归一化，越多越接近主文字色（不与涨跌色混淆）
+    v = volume / volume.max() if volume.max() > 0 else volume
+    light = np.array(theme['text_primary'], dtype=float)
+    strip = colors + (light - colors) * (0.3 + 0.6 * v)[:, None]
+    return colors.astype(np.uint8), strip.astype(np.uint8), v > 0
+
+
+def _render_grid(rows, cols, n_rows: int, n_cols: int, colors, strip, has_strip, cell: int, gap: int):
+    """把格子颜色放大成 RGBA 像素块（无逐格绘制）"""
+    import numpy as np
+    
+    inner = cell - gap
+    strip_h = max(inner // 4, 2)
+    
+    grid = np.zeros((n_rows, n_cols, 4), dtype=np.uint8)
+    grid[rows, cols, :3] = colors
+    grid[rows, cols, 3] = 255
+    strip_grid = np.zeros((n_rows, n_cols, 3), dtype=np.uint8)
+    strip_grid[rows, cols] = strip
+    strip_on = np.zeros((n_rows, n_cols), dtype=bool)
+    strip_on[rows, cols] = has_strip
+    
+    pixels = grid.repeat(cell, 0).repeat(cell, 1)
+    
+    # 格子间留缝
+    tile = np.zeros((cell, cell), dtype=bool)
+    tile[:inner, :inner] = True
+    pixels[~np.tile(tile, (n_rows, n_cols)), 3] = 0
+    
+    # 格子底部运动量条
+    strip_tile = np.zeros((cell, cell), dtype=bool)
+    strip_tile[inner - strip_h:inner, :inner] = True
+    mask = np.tile(strip_tile, (n_rows, n_cols)) & strip_on.repeat(cell, 0).repeat(cell, 1)
+    pixels[mask, :3] = strip_grid.repeat(cell, 0).repeat(cell, 1)[mask]
+    
+    return Image.fromarray(pixels, 'RGBA')
+
+
+@instrumented("generate_heatmap_card")
+def generate_heatmap_card(records: dict, year: int, month: int | None = None) -> bytes:
+    """生成月度 / 年度日历热力图卡片
+
+    records 为 {ISO 日期: 当日处方记录}，格子颜色表示 ROI，底部条表示运动量。
+    """
+    import numpy as np
     
-    # 二维码
-    qr_size = 48
-    qr_img = _generate_qrcode(SHARE_URL, qr_size, dark_mode=is_loss)
-    qr_x = width - padding - qr_size
-    qr_y = y + 3
-    img.paste(qr_img, (qr_x, qr_y))
+    start = date(year, month or 1, 1)
+    if month:
+        end = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    else:
+        end = date(year, 12, 31)
+    n = (end - start).days + 1
+    
+    # 每天的 ROI 和运动数量
+    roi = np.full(n, np.nan)
+    volume = np.zeros(n)
+    total_pnl = 0.0
+    for day, r in records.items():
+        idx = (date.fromisoformat(day) - start).days
+        if 0 <= idx < n and r:
+            roi[idx] = float(r.get('roi', 0))
+            volume[idx] = len(_parse_exercises(r.get('exercise', '')))
+            total_pnl += float(r.get('amount', 0))
+    
+    is_loss = total_pnl < 0
+    theme = THEMES[is_loss]
     
-    # 输出
-    buffer = BytesIO()
-    img.save(buffer, format='PNG', quality=95)
-    buffer.seek(0)
-    return buffer.getvalue()
+    width = 540
+    padding = 32
+    content_width = width - padding * 2
+    
+    # 布局：月度为 7 列日历，年度为按周排列的 7 行
+    offset = np.arange(n) + start.weekday()
+    if month:
+        rows, cols = offset // 7, offset % 7
+        n_rows, n_cols = int(rows.max()) + 1, 7
+        gap = 6
+    else:
+        rows, cols = offset % 7, offset // 7
+        n_rows, n_cols = 7, int(cols.max()) + 1
+        gap = 2
+    cell = content_width // n_cols
+    
+    colors, strip, has_strip = _heatmap_colors(roi, volume, theme)
+    grid_img = _render_grid(rows, cols, n_rows, n_cols, colors, strip, has_strip, cell, gap)
+    
+    header_h = 130
+    label_h = 22
+    footer_h = 75
+    total_h = padding + header_h + label_h + grid_img.size[1] + 40 + footer_h + padding
+    
+    img = Image.new('RGB', (width, total_h), theme['gradient_top'])
+    _draw_gradient(img, theme['gradient_top'], theme['gradient_bottom'])
+    draw = ImageDraw.Draw(img)
+    
+    # ===== 头部 =====
+    y = padding
+    title = f"韭菜月度账单 · {year}.{month:02d}" if month else f"韭菜年度账单 · {year}"
+    draw.text((padding, y), title, font=_get_font(26), fill=theme['text_primary'])
+    y += 40
+    draw.text((padding, y), "红涨绿跌，底部亮条越亮运动越多", font=_get_font(12), fill=theme['text_secondary'])
+    y += 26
+    
+    days = int((~np.isnan(roi)).sum())
+    prefix = "+" if total_pnl > 0 else ""
+    draw.text((padding, y), f"{prefix}¥{total_pnl:,.2f}", font=_get_font(26), fill=theme['accent'])
+    draw.text((width - padding, y + 8), f"打卡 {days} 天 · 运动 {int(volume.sum())} 项",
+              font=_get_font(14), anchor="rt", fill=theme['text_secondary'])
+    y = padding + header_h
+    
+    # ===== 列标签 =====
+    font_label = _get_font(12)
+    if month:
+        for i, name in enumerate("一二三四五六日"):
+            draw.text((padding + i * cell + (cell - gap) // 2, y), name, font=font_label, anchor="mt", fill=theme['text_secondary'])
+    else:
+        for m in range(1, 13):
+            col = (date(year, m, 1) - start).days + start.weekday()
+            draw.text((padding + (col // 7) * cell, y), f"{m}月", font=font_label, fill=theme['text_secondary'])
+    y += label_h
+    
+    # ===== 格子 =====
+    img.paste(grid_img, (padding, y), grid_img)
+    if month:
+        # 月度格子较大，标上日期
+        for i in range(n):
+            draw.text((padding + int(cols[i]) * cell + 6, y + int(rows[i]) * cell + 4), str(i + 1),
+                      font=font_label, fill=theme['text_primary'])
+    y += grid_img.size[1] + 40
+    
+    # ===== 底部 =====
+    _draw_footer(img, draw, y, padding, theme, is_loss)
+    
+    return _to_png(img)
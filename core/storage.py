@@ -0,0 +1,322 @@
+"""
+存储模块 - 可插拔的存储后端（Supabase / 本地 SQLite）
+"""
+
+import json
+import sqlite3
+import threading
+
+
+class Storage:
+    """存储后端接口"""
+
+    def get_settings(self, user_id: str) -> dict | None:
+        """读取用户设置"""
+        raise NotImplementedError
+
+    def upsert_settings(self, data: dict):
+        """写入用户设置（data 必须包含 id）"""
+        raise NotImplementedError
+
+    def list_settings(self, after: str | None, limit: int) -> list[dict]:
+        """按 id 升序读取 id 大于 after 的用户设置（键集分页）"""
+        raise NotImplementedError
+
+    def get_daily_record(self, user_id: str, day: str) -> dict | None:
+        """读取某天的处方记录"""
+        raise NotImplementedError
+
+    def upsert_daily_record(self, user_id: str, day: str, record: dict):
+        """写入某天的处方记录"""
+        raise NotImplementedError
+
+    def get_daily_records(self, user_id: str, days: list[str]) -> dict[str, dict]:
+        """批量读取多天的处方记录，返回 {date: record}"""
+        raise NotImplementedError
+
+    def upsert_daily_records(self, user_id: str, rows: list[tuple[str, dict]]):
+        """批量写入处方记录，rows 为 [(date, record), ...]"""
+        raise NotImplementedError
+
+    def list_daily_records(self, user_id: str, before: str | None, limit: int) -> list[dict]:
+        """按日期倒序读取历史记录，每行为 {date, record}"""
+        raise NotImplementedError
+
+    def get_stats(self, user_id: str) -> dict | None:
+        """读取用户聚合统计"""
+        raise NotImplementedError
+
+    def upsert_stats(self, user_id: str, stats: dict):
+        """写入用户聚合统计"""
+        raise NotImplementedError
+
+    def apply_stats_delta(self, user_id: str, delta: dict):
+        """原子合并一条记录带来的统计增量（见 db._stats_delta）"""
+        raise NotImplementedError
+
+    def apply_stats_deltas(self, user_id: str, deltas: list[dict]):
+        """按顺序原子合并一批统计增量（批量导入用）"""
+        raise NotImplementedError
+
+    def increment_counters(self, day: str, deltas: dict[tuple[str, str], int]):
+        """原子累加社区计数器，deltas 为 {(kind, key): 增量}"""
+        raise NotImplementedError
+
+    def get_counters(self, day: str) -> dict[str, dict[str, int]]:
+        """读取某天的社区计数器，返回 {kind: {key: count}}（不含已减到 0 的键）"""
+        raise NotImplementedError
+
+
+class SupabaseStorage(Storage):
+    """Supabase 存储后端"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_settings(self, user_id: str) -> dict | None:
+        resp = self.client.table("user_settings").select("*").eq("id", user_id).execute()
+        return resp.data[0] if resp.data else None
+
+    def upsert_settings(self, data: dict):
+        self.client.table("user_settings").upsert(data).execute()
+
+    def list_settings(self, after: str | None, limit: int) -> list[dict]:
+        query = self.client.table("user_settings").select("*")
+        if after is not None:
+            query = query.gt("id", after)
+        return query.order("id").limit(limit).execute().data or []
+
+    def get_daily_record(self, user_id: str, day: str) -> dict | None:
+        resp = self.client.table("daily_records").select("record") \
+            .eq("user_id", user_id).eq("date", day).execute()
+        return resp.data[0]['record'] if resp.data else None
+
+    def upsert_daily_record(self, user_id: str, day: str, record: dict):
+        self.client.table("daily_records").upsert(
+            {"user_id": user_id, "date": day, "record": record},
+            on_conflict="user_id,date"
+        ).execute()
+
+    def get_daily_records(self, user_id: str, days: list[str]) -> dict[str, dict]:
+        resp = self.client.table("daily_records").select("date, record") \
+            .eq("user_id", user_id).in_("date", days).execute()
+        return {row['date']: row['record'] for row in resp.data or []}
+
+    def upsert_daily_records(self, user_id: str, rows: list[tuple[str, dict]]):
+        self.client.table("daily_records").upsert(
+            [{"user_id": user_id, "date": day, "record": record} for day, record in rows],
+            on_conflict="user_id,date"
+        ).execute()
+
+    def list_daily_records(self, user_id: str, before: str | None, limit: int) -> list[dict]:
+        query = self.client.table("daily_records").select("date, record").eq("user_id", user_id)
+        if before:
+            query = query.lt("date", before)
+        return query.order("date", desc=True).limit(limit).execute().data or []
+
+    def get_stats(self, user_id: str) -> dict | None:
+        resp = self.client.table("user_stats").select("*").eq("user_id", user_id).execute()
+        return resp.data[0] if resp.data else None
+
+    def upsert_stats(self, user_id: str, stats: dict):
+        self.client.table("user_stats").upsert({"user_id": user_id, **stats}).execute()
+
+    def apply_stats_delta(self, user_id: str, delta: dict):
+        # 读-改-写放在数据库函数里加行锁完成
+        self.client.rpc("apply_user_stats_delta", {"p_user_id": user_id, "p_delta": delta}).execute()
+
+    def apply_stats_deltas(self, user_id: str, deltas: list[dict]):
+        self.client.rpc("apply_user_stats_deltas", {"p_user_id": user_id, "p_deltas": deltas}).execute()
+
+    def increment_counters(self, day: str, deltas: dict[tuple[str, str], int]):
+        # 多个会话并发累加，走数据库函数保证原子性
+        self.client.rpc("increment_community_counters", {
+            "p_date": day,
+            "p_deltas": [{"kind": kind, "key": key, "delta": delta} for (kind, key), delta in deltas.items()],
+        }).execute()
+
+    def get_counters(self, day: str) -> dict[str, dict[str, int]]:
+        resp = self.client.table("community_counters").select("kind, key, count").eq("date", day).gt("count", 0).execute()
+        counters = {}
+        for row in resp.data or []:
+            counters.setdefault(row['kind'], {})[row['key']] = row['count']
+        return counters
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_settings (
+    id TEXT PRIMARY KEY,
+    api_key TEXT,
+    exercises TEXT,
+    model TEXT,
+    model_name TEXT,
+    total_assets REAL,
+    today_record TEXT,
+    record_date TEXT,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS daily_records (
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (user_id, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id TEXT PRIMARY KEY,
+    stats TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS community_counters (
+    date TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (date, kind, key)
+) WITHOUT ROWID;
+"""
+
+# JSON 字段（SQLite 中以文本存储）
+_JSON_COLUMNS = ('exercises', 'today_record')
+_SETTINGS_COLUMNS = ('id', 'api_key', 'exercises', 'model', 'model_name',
+                     'total_assets', 'today_record', 'record_date')
+
+
+class SQLiteStorage(Storage):
+    """本地 SQLite 存储后端（WAL 模式，每线程一个连接）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self) -> sqlite3.Connection:
+        """获取当前线程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, cached_statements=64)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def get_settings(self, user_id: str) -> dict | None:
+        row = self._conn().execute("SELECT * FROM user_settings WHERE id = ?", (user_id,)).fetchone()
+        return self._settings_row(row) if row else None
+
+    @staticmethod
+    def _settings_row(row: sqlite3.Row) -> dict:
+        """解析设置行中的 JSON 字段"""
+        data = dict(row)
+        for col in _JSON_COLUMNS:
+            if data.get(col):
+                data[col] = json.loads(data[col])
+        return data
+
+    def upsert_settings(self, data: dict):
+        cols = [c for c in _SETTINGS_COLUMNS if c in data]
+        values = [json.dumps(data[c], ensure_ascii=False) if c in _JSON_COLUMNS and data[c] is not None else data[c]
+                  for c in cols]
+        updates = ', '.join(f"{c} = excluded.{c}" for c in cols if c != 'id')
+        sql = (f"INSERT INTO user_settings ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+               f"ON CONFLICT(id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP")
+        with self._conn() as conn:
+            conn.execute(sql, values)
+
+    def list_settings(self, after: str | None, limit: int) -> list[dict]:
+        rows = self._conn().execute(
+            "SELECT * FROM user_settings WHERE id > ? ORDER BY id LIMIT ?", (after or '', limit)
+        ).fetchall()
+        return [self._settings_row(r) for r in rows]
+
+    def get_daily_record(self, user_id: str, day: str) -> dict | None:
+        row = self._conn().execute(
+            "SELECT record FROM daily_records WHERE user_id = ? AND date = ?", (user_id, day)
+        ).fetchone()
+        return json.loads(row['record']) if row else None
+
+    def upsert_daily_record(self, user_id: str, day: str, record: dict):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO daily_records (user_id, date, record) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id, date) DO UPDATE SET record = excluded.record",
+                (user_id, day, json.dumps(record, ensure_ascii=False))
+            )
+
+    def get_daily_records(self, user_id: str, days: list[str]) -> dict[str, dict]:
+        if not days:
+            return {}
+        rows = self._conn().execute(
+            f"SELECT date, record FROM daily_records WHERE user_id = ? AND date IN ({', '.join('?' * len(days))})",
+            (user_id, *days)
+        ).fetchall()
+        return {r['date']: json.loads(r['record']) for r in rows}
+
+    def upsert_daily_records(self, user_id: str, rows: list[tuple[str, dict]]):
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO daily_records (user_id, date, record) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id, date) DO UPDATE SET record = excluded.record",
+                [(user_id, day, json.dumps(record, ensure_ascii=False)) for day, record in rows]
+            )
+
+    def list_daily_records(self, user_id: str, before: str | None, limit: int) -> list[dict]:
+        rows = self._conn().execute(
+            "SELECT date, record FROM daily_records WHERE user_id = ? AND date < ? "
+            "ORDER BY date DESC LIMIT ?",
+            (user_id, before or '9999-12-31', limit)
+        ).fetchall()
+        return [{"date": r['date'], "record": json.loads(r['record'])} for r in rows]
+
+    def get_stats(self, user_id: str) -> dict | None:
+        row = self._conn().execute("SELECT stats FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row['stats']) if row else None
+
+    def upsert_stats(self, user_id: str, stats: dict):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO user_stats (user_id, stats) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET stats = excluded.stats",
+                (user_id, json.dumps(stats, ensure_ascii=False))
+            )
+
+    def apply_stats_delta(self, user_id: str, delta: dict):
+        self.apply_stats_deltas(user_id, [delta])
+
+    def apply_stats_deltas(self, user_id: str, deltas: list[dict]):
+        from .db import _apply_delta
+
+        conn = self._conn()
+        with conn:
+            # 立即取得写锁，读-改-写期间其它连接只能等待
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT stats FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+            stats = json.loads(row['stats']) if row else None
+            for delta in deltas:
+                stats = _apply_delta(stats, delta)
+            conn.execute(
+                "INSERT INTO user_stats (user_id, stats) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET stats = excluded.stats",
+                (user_id, json.dumps(stats, ensure_ascii=False))
+            )
+
+    def increment_counters(self, day: str, deltas: dict[tuple[str, str], int]):
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO community_counters (date, kind, key, count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(date, kind, key) DO UPDATE SET count = count + excluded.count",
+                [(day, kind, key, delta) for (kind, key), delta in deltas.items()]
+            )
+
+    def get_counters(self, day: str) -> dict[str, dict[str, int]]:
+        rows = self._conn().execute(
+            "SELECT kind, key, count FROM community_counters WHERE date = ? AND count > 0", (day,)
+        ).fetchall()
+        counters = {}
+        for r in rows:
+            counters.setdefault(r['kind'], {})[r['key']] = r['count']
+        return counters
@@ -0,0 +1,135 @@
+"""
+预热模块 - 进程启动或登录后在后台预建连接、加载字体和二维码
+
+时间预算和取消只在步骤之间检查：已开始的步骤（如建库连接、加载字体）会执行完，可能超出预算。
+"""
+
+import threading
+import time
+
+from .db import _get_secret
+
+# 预热总时间预算（秒）
+DEFAULT_BUDGET = 10.0
+# 登录预热时，连接在这段时间内预建过就不再重复（秒，约为服务端 keep-alive 时长）
+HTTP_FRESH_SECONDS = 60.0
+
+_lock = threading.Lock()
+_thread = None
+_login_thread = None
+_http_warmed_at = None
+_cancel = threading.Event()
+_status = {}
+
+
+def _warm_config():
+    """解析配置和 Prompt"""
+    import config
+    config.SYSTEM_PROMPT, config.MODELS, config.API_URL
+
+
+def _warm_storage():
+    """建立数据库连接"""
+    from .db import get_storage
+    get_storage()
+
+
+def _warm_http(timeout: float):
+    """预建到 AI 接口的 DNS/TLS 连接（响应内容无所谓）"""
+    global _http_warmed_at
+    from config import API_URL
+    from .ai import get_http_session
+    get_http_session().head(API_URL, timeout=timeout)
+    _http_warmed_at = time.monotonic()
+
+
+def _warm_share():
+    """加载字体和二维码"""
+    from .share import preload_assets
+    preload_assets()
+
+
+# 预热步骤，按收益从高到低排列
+_STEPS = [
+    ("config", lambda remaining: _warm_config()),
+    ("storage", lambda remaining: _warm_storage()),
+    ("http", _warm_http),
+    ("share", lambda remaining: _warm_share()),
+]
+
+
+def _run(budget: float, steps=_STEPS):
+    """依次执行预热步骤，超出预算或被取消时跳过剩余步骤（只在步骤之间检查）"""
+    deadline = time.monotonic() + budget
+    for name, step in steps:
+        remaining = deadline - time.monotonic()
+        if _cancel.is_set() or remaining <= 0:
+            _status[name] = "skipped"
+            continue
+        t0 = time.perf_counter()
+        try:
+            step(remaining)
+            _status[name] = f"ok {(time.perf_counter() - t0) * 1000:.0f}ms"
+        except Exception as e:
+            _status[name] = f"error {type(e).__name__}"
+
+
+def is_enabled() -> bool:
+    """是否开启预热（WARMUP=1）"""
+    return _get_secret("WARMUP", "").lower() in ("1", "true", "yes")
+
+
+def start_warmup(budget: float = DEFAULT_BUDGET, force: bool = False) -> bool:
+    """启动后台预热（每个进程只执行一次），返回是否新启动"""
+    global _thread
+    
+    if not force and not is_enabled():
+        return False
+    
+    with _lock:
+        if _thread is not None:
+            return False
+        _cancel.clear()
+        _thread = threading.Thread(target=_run, args=(budget,), name="warmup", daemon=True)
+        _thread.start()
+    return True
+
+
+def _login_steps() -> list:
+    """登录时仍需执行的步骤：连接池里的连接可能已空闲断开，字体和二维码只需加载成功一次"""
+    steps = []
+    if _http_warmed_at is None or time.monotonic() - _http_warmed_at > HTTP_FRESH_SECONDS:
+        steps.append(("http", _warm_http))
+    if not _status.get("share", "").startswith("ok"):
+        steps.append(("share", lambda remaining: _warm_share()))
+    return steps
+
+
+def warm_login(budget: float = DEFAULT_BUDGET, force: bool = False) -> bool:
+    """登录后在后台补做预热（进程预热仍在进行时跳过），返回是否新启动"""
+    global _login_thread
+    
+    if not force and not is_enabled():
+        return False
+    
+    with _lock:
+        for thread in (_thread, _login_thread):
+            if thread is not None and thread.is_alive():
+                return False
+        steps = _login_steps()
+        if not steps:
+            return False
+        _cancel.clear()
+        _login_thread = threading.Thread(target=_run, args=(budget, steps), name="warmup-login", daemon=True)
+        _login_thread.start()
+    return True
+
+
+def cancel_warmup():
+    """取消尚未执行的预热步骤，让位给前台请求（正在执行的步骤不会被打断）"""
+    _cancel.set()
+
+
+def warmup_status() -> dict:
+    """各预热步骤的执行结果"""
+    return dict(_status)